@@ -0,0 +1,127 @@
+# See LICENSE for details
+"""Shared ELF build stage for river_core"""
+import os
+import datetime
+
+from river_core.log import logger
+from river_core.utils import testRunner
+
+#: Name of the ELF built in the work_dir of every test
+elf_name = 'test.elf'
+
+
+def compile_command(attr, elf=elf_name):
+    '''
+        Create the GCC command which builds the ELF of a test from its test
+        list entry. This is the same command the DuT and Reference plugins
+        generate in their build hooks.
+
+        :param attr: Test List entry of the test
+
+        :param elf: Name of the ELF to create
+
+        :type attr: dict
+
+        :type elf: str
+
+        :returns: The compile command, None if the entry does not name a
+            compiler
+
+        :rtype: str
+    '''
+    if not attr.get('cc'):
+        return None
+    command = '{0} {1} -march={2} -mabi={3} {4} {5} {6}'.format(
+        attr['cc'], attr.get('cc_args') or '', attr['march'], attr['mabi'],
+        attr['linker_args'], attr.get('linker_file') or '', attr['asm_file'])
+    for x in attr.get('extra_compile') or []:
+        command += ' ' + x
+    for x in attr.get('include') or []:
+        command += ' -I ' + str(x)
+    command += ''.join(
+        map(' -D{0}'.format, attr.get('compile_macros') or []))
+    command += ' -o ' + elf
+    return command
+
+
+def build_elfs(test_dict, report_dir, jobs=1, timeout=240, cache=None):
+    '''
+        Build the ELF of every test once, in the work_dir of the test. The
+        path of the ELF is recorded in the ``elf`` field of the entry, so the
+        DuT and Reference plugins can use the same binary instead of
+        compiling the test again. Tests which fail to build are left without
+        an ``elf`` field and are compiled by the plugins as before.
+
+        With a cache, the ELFs of tests whose sources have not changed are
+        linked from the cache instead of being compiled, and the newly built
+        ELFs are added to it.
+
+        :param test_dict: The loaded test list, updated in place
+
+        :param report_dir: Directory to write the JSON report of the builds to
+
+        :param jobs: Number of tests to build in parallel
+
+        :param timeout: Timeout for building a test in seconds
+
+        :param cache: Cache to reuse the ELFs from
+
+        :type test_dict: dict
+
+        :type report_dir: str
+
+        :type jobs: int
+
+        :type timeout: int
+
+        :type cache: river_core.cache.ElfCache
+
+        :returns: Names of the tests which were built
+
+        :rtype: list
+    '''
+    runner = testRunner(jobs=jobs, timeout=timeout)
+    built = []
+    keys = {}
+    for test, attr in test_dict.items():
+        attr.pop('elf', None)
+        command = compile_command(attr)
+        if command is None:
+            logger.warning(
+                'No compiler in the test list for {0}, not building it'.format(
+                    test))
+            continue
+        elf = os.path.join(os.path.abspath(attr['work_dir']), elf_name)
+        if cache is not None:
+            keys[test] = cache.key(attr)
+            if keys[test] is not None and cache.lookup(keys[test]):
+                logger.debug('Using the cached ELF for ' + test)
+                cache.materialise(keys[test], elf)
+                attr['elf'] = elf
+                built.append(test)
+                continue
+        # Never write through a link to a cached ELF
+        if os.path.lexists(elf):
+            os.remove(elf)
+        runner.add_test(test, command, cwd=attr['work_dir'])
+
+    os.makedirs(report_dir, exist_ok=True)
+    report_file = os.path.join(
+        report_dir, 'build_{0}.json'.format(
+            datetime.datetime.now().strftime("%Y%m%d-%H%M")))
+    if cache is not None:
+        logger.info('Reused {0} ELFs from the cache'.format(len(built)))
+    logger.info('Building the ELFs of {0} tests'.format(len(runner.tests)))
+    for test, entry in runner.execute(report_file).items():
+        if entry['outcome'] != 'passed':
+            continue
+        elf = os.path.join(os.path.abspath(test_dict[test]['work_dir']),
+                           elf_name)
+        test_dict[test]['elf'] = elf
+        built.append(test)
+        if keys.get(test) is not None:
+            cache.store(keys[test], elf)
+    if cache is not None:
+        cache.evict()
+        cache.save_stats()
+    return built
@@ -0,0 +1,389 @@
+# See LICENSE for details
+"""Content addressed caches for the artifacts built by river_core"""
+import os
+import gzip
+import json
+import shutil
+import hashlib
+import tempfile
+import subprocess
+
+from river_core.log import logger
+
+#: Default size limit of a cache in MB
+default_size = 1024
+
+
+def _hash_file(digest, path):
+    digest.update(path.encode() + b'\0')
+    with open(path, 'rb') as source:
+        for block in iter(lambda: source.read(1024 * 1024), b''):
+            digest.update(block)
+
+
+class ArtifactCache():
+    """
+    A directory of files stored under the hash of whatever they were made
+    from. Entries are bounded to ``size`` MB in total and the least recently
+    used ones are evicted first, the modification time of an entry being
+    updated on every hit. Counters of the hits, misses and evictions are kept
+    in ``stats.json`` in the cache directory across runs.
+    """
+
+    #: Extension of the entries in the cache
+    extension = ''
+
+    def __init__(self, cache_dir, size=default_size):
+        """Constructor.
+
+        :param cache_dir: Directory holding the cache. Created if it does not
+            exist.
+
+        :param size: Size limit of the cache in MB
+
+        :type cache_dir: str
+
+        :type size: int
+        """
+        self.cache_dir = os.path.abspath(os.path.expanduser(cache_dir))
+        self.size = size * 1024 * 1024
+        self.stats_file = os.path.join(self.cache_dir, 'stats.json')
+        self.counters = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def path(self, key):
+        """
+        Get the path of the entry for a key.
+
+        :param key: Hash of the entry
+
+        :type key: str
+
+        :rtype: str
+        """
+        return os.path.join(self.cache_dir, key[:2], key + self.extension)
+
+    def lookup(self, key):
+        """
+        Look up an entry and mark it as recently used.
+
+        :param key: Hash of the entry
+
+        :type key: str
+
+        :returns: Path of the entry, None on a miss
+
+        :rtype: str
+        """
+        path = self.path(key)
+        try:
+            os.utime(path)
+        except OSError:
+            self.counters['misses'] += 1
+            return None
+        self.counters['hits'] += 1
+        return path
+
+    def store(self, key, source):
+        """
+        Copy a file into the cache. The entry is made read-only, since it
+        may be hard linked into the work directories of the tests.
+
+        :param key: Hash of the entry
+
+        :param source: Path of the file to store
+
+        :type key: str
+
+        :type source: str
+        """
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_file = tempfile.mkstemp(dir=os.path.dirname(path))
+        os.close(fd)
+        try:
+            shutil.copyfile(source, tmp_file)
+            os.chmod(tmp_file, 0o444)
+            os.replace(tmp_file, path)
+        except OSError:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+            raise
+        self.counters['stores'] += 1
+
+    def materialise(self, key, dest):
+        """
+        Place the entry for a key at ``dest``, as a hard link when the cache
+        and ``dest`` are on the same filesystem and as a copy otherwise.
+
+        :param key: Hash of the entry
+
+        :param dest: Path to place the entry at. Replaced if it exists.
+
+        :type key: str
+
+        :type dest: str
+        """
+        path = self.path(key)
+        if os.path.lexists(dest):
+            os.remove(dest)
+        try:
+            os.link(path, dest)
+        except OSError:
+            shutil.copyfile(path, dest)
+
+    def entries(self):
+        """
+        List the entries in the cache.
+
+        :returns: List of (path, size, mtime) tuples
+
+        :rtype: list
+        """
+        entries = []
+        for shard in os.scandir(self.cache_dir):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith(self.extension) and entry.is_file():
+                    stat = entry.stat()
+                    entries.append((entry.path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache fits in its
+        size limit.
+
+        :returns: Number of entries removed
+
+        :rtype: int
+        """
+        entries = self.entries()
+        total = sum(size for path, size, mtime in entries)
+        removed = 0
+        for path, size, mtime in sorted(entries, key=lambda x: x[2]):
+            if total <= self.size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        self.counters['evictions'] += removed
+        return removed
+
+    def clear(self):
+        """
+        Remove all the entries and counters of the cache.
+        """
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.counters = dict.fromkeys(self.counters, 0)
+
+    def stats(self):
+        """
+        Get the statistics of the cache, accumulated over all runs including
+        the pending counters of this one.
+
+        :returns: Dict with the ``entries``, ``size`` and ``limit`` of the
+            cache in bytes along with the ``hits``, ``misses``, ``stores``
+            and ``evictions``
+
+        :rtype: dict
+        """
+        stats = dict.fromkeys(self.counters, 0)
+        try:
+            with open(self.stats_file, 'r') as stats_file:
+                stats.update(json.load(stats_file))
+        except (OSError, ValueError):
+            pass
+        for counter, value in self.counters.items():
+            stats[counter] += value
+        entries = self.entries()
+        stats['entries'] = len(entries)
+        stats['size'] = sum(size for path, size, mtime in entries)
+        stats['limit'] = self.size
+        return stats
+
+    def save_stats(self):
+        """
+        Add the counters of this run to ``stats.json``.
+        """
+        stats = self.stats()
+        fd, tmp_file = tempfile.mkstemp(dir=self.cache_dir)
+        with os.fdopen(fd, 'w') as stats_file:
+            json.dump({counter: stats[counter] for counter in self.counters},
+                      stats_file)
+        os.chmod(tmp_file, 0o644)
+        os.replace(tmp_file, self.stats_file)
+        self.counters = dict.fromkeys(self.counters, 0)
+
+    def log_stats(self):
+        """
+        Log the statistics of the cache.
+        """
+        stats = self.stats()
+        lookups = stats['hits'] + stats['misses']
+        logger.info('Cache {0}: {1} entries, {2:.1f}/{3:.1f} MB'.format(
+            self.cache_dir, stats['entries'], stats['size'] / 1048576,
+            stats['limit'] / 1048576))
+        logger.info(
+            'Cache {0}: {1} hits, {2} misses ({3:.1f}% hit rate), {4} stores, '
+            '{5} evictions'.format(
+                self.cache_dir, stats['hits'], stats['misses'],
+                100.0 * stats['hits'] / lookups if lookups else 0,
+                stats['stores'], stats['evictions']))
+
+
+class ElfCache(ArtifactCache):
+    """
+    Cache of the ELFs built from the tests. An ELF is keyed on the contents
+    of the assembly, the linker script and the extra compile sources of the
+    test, its macros, include directories, ``cc_args``, ``linker_args``,
+    ``march`` and ``mabi``, and the version reported by the compiler.
+    """
+
+    extension = '.elf'
+
+    def __init__(self, cache_dir, size=default_size):
+        super().__init__(cache_dir, size)
+        self.versions = {}
+
+    def _cc_version(self, cc):
+        if cc not in self.versions:
+            try:
+                self.versions[cc] = subprocess.run(
+                    [cc, '--version'],
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.DEVNULL,
+                    timeout=60).stdout
+            except (OSError, subprocess.TimeoutExpired):
+                self.versions[cc] = b''
+        return self.versions[cc]
+
+    def key(self, attr):
+        """
+        Compute the key of the ELF of a test.
+
+        :param attr: Test List entry of the test
+
+        :type attr: dict
+
+        :returns: The key, None if a source of the test cannot be read
+
+        :rtype: str
+        """
+        digest = hashlib.sha256()
+        digest.update(self._cc_version(attr['cc']))
+        for field in ('cc_args', 'linker_args', 'march', 'mabi'):
+            digest.update('{0}={1}\0'.format(field, attr.get(field)).encode())
+        for field in ('compile_macros', 'include'):
+            digest.update('{0}={1}\0'.format(
+                field, sorted(map(str, attr.get(field) or []))).encode())
+        # The paths are hashed along with the contents since the compiler
+        # records the source file names in the ELF
+        try:
+            for field in ('asm_file', 'linker_file'):
+                if attr.get(field):
+                    digest.update(field.encode() + b'\0')
+                    _hash_file(
+                        digest,
+                        os.path.join(attr['work_dir'], attr[field]))
+            for source in attr.get('extra_compile') or []:
+                _hash_file(digest, os.path.join(attr['work_dir'], source))
+        except OSError:
+            return None
+        return digest.hexdigest()
+
+
+class RefCache(ArtifactCache):
+    """
+    Cache of the dumps generated by the Reference plugins, which are
+    deterministic for a given ELF and configuration of the reference model.
+    A dump is keyed on the contents of the ELF and the configuration of the
+    Reference plugins, and is stored gzip compressed.
+    """
+
+    extension = '.dump.gz'
+
+    def key(self, elf, ref_config):
+        """
+        Compute the key of the reference dump of an ELF.
+
+        :param elf: Path to the ELF of the test
+
+        :param ref_config: Configuration of the reference model, including
+            anything which identifies the version of the simulator
+
+        :type elf: str
+
+        :type ref_config: dict
+
+        :returns: The key, None if the ELF cannot be read
+
+        :rtype: str
+        """
+        digest = hashlib.sha256()
+        digest.update(json.dumps(ref_config, sort_keys=True).encode() + b'\0')
+        try:
+            with open(elf, 'rb') as source:
+                for block in iter(lambda: source.read(1024 * 1024), b''):
+                    digest.update(block)
+        except OSError:
+            return None
+        return digest.hexdigest()
+
+    def store(self, key, source):
+        """
+        Compress a dump into the cache.
+
+        :param key: Hash of the entry
+
+        :param source: Path of the dump to store
+
+        :type key: str
+
+        :type source: str
+        """
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_file = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with open(source, 'rb') as dump, os.fdopen(fd, 'wb') as out, \
+                    gzip.GzipFile(fileobj=out, mode='wb',
+                                  compresslevel=6) as cached:
+                shutil.copyfileobj(dump, cached, 1024 * 1024)
+            os.chmod(tmp_file, 0o444)
+            os.replace(tmp_file, path)
+        except OSError:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+            raise
+        self.counters['stores'] += 1
+
+    def materialise(self, key, dest):
+        """
+        Decompress the dump for a key to ``dest``.
+
+        :param key: Hash of the entry
+
+        :param dest: Path to write the dump to. Replaced if it exists.
+
+        :type key: str
+
+        :type dest: str
+        """
+        fd, tmp_file = tempfile.mkstemp(dir=os.path.dirname(
+            os.path.abspath(dest)))
+        try:
+            with gzip.open(self.path(key), 'rb') as cached, \
+                    os.fdopen(fd, 'wb') as dump:
+                shutil.copyfileobj(cached, dump, 1024 * 1024)
+            os.chmod(tmp_file, 0o644)
+            os.replace(tmp_file, dest)
+        except OSError:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+            raise
@@ -0,0 +1,292 @@
+# See LICENSE for details
+"""Dump comparison engine for river_core"""
+import os
+import mmap
+import concurrent.futures
+
+from river_core.log import logger
+
+#: Number of bytes compared in one go while walking the dumps
+chunk_size = 4 * 1024 * 1024
+#: Number of lines captured around the first divergence
+context_lines = 3
+
+
+def _first_difference(dut_map, ref_map, start, end):
+    '''
+        Narrow down the first differing byte between two mapped regions
+        which are known to differ in ``[start, end)``.
+
+        :param dut_map: Mapped DuT dump
+
+        :param ref_map: Mapped reference dump
+
+        :param start: Offset at which the differing region begins
+
+        :param end: Offset at which the differing region ends
+
+        :type dut_map: mmap.mmap
+
+        :type ref_map: mmap.mmap
+
+        :type start: int
+
+        :type end: int
+
+        :returns: Byte offset of the first mismatch
+
+        :rtype: int
+    '''
+    # Halve the window while the left half still matches; slices are
+    # compared in C so this stays cheap even for large chunks.
+    while end - start > 64:
+        mid = (start + end) // 2
+        if dut_map[start:mid] == ref_map[start:mid]:
+            start = mid
+        else:
+            end = mid
+    for offset in range(start, end):
+        if dut_map[offset] != ref_map[offset]:
+            return offset
+    return end
+
+
+def _line_number(dump_map, offset):
+    '''
+        Count the line on which ``offset`` lies (1-indexed).
+
+        :param dump_map: Mapped dump
+
+        :param offset: Byte offset in the dump
+
+        :type dump_map: mmap.mmap
+
+        :type offset: int
+
+        :rtype: int
+    '''
+    lines = 1
+    for start in range(0, offset, chunk_size):
+        lines += dump_map[start:min(start + chunk_size, offset)].count(b'\n')
+    return lines
+
+
+def _context(dump_map, offset, context):
+    '''
+        Extract the line containing ``offset`` along with ``context`` lines
+        on either side of it.
+
+        :param dump_map: Mapped dump, None for an empty file
+
+        :param offset: Byte offset in the dump
+
+        :param context: Number of lines to capture on either side
+
+        :type dump_map: mmap.mmap
+
+        :type offset: int
+
+        :type context: int
+
+        :rtype: list
+    '''
+    if dump_map is None:
+        return []
+    size = len(dump_map)
+    offset = min(offset, size)
+    start = dump_map.rfind(b'\n', 0, offset) + 1
+    for _ in range(context):
+        if start == 0:
+            break
+        start = dump_map.rfind(b'\n', 0, start - 1) + 1
+    end = offset
+    for _ in range(context + 1):
+        end = dump_map.find(b'\n', end, size)
+        if end == -1:
+            end = size
+            break
+        end = end + 1
+    text = dump_map[start:end].decode('ascii', errors='replace')
+    return text.splitlines()
+
+
+def _map(dump_file):
+    '''
+        Memory map a dump in read-only mode. Empty files cannot be mapped and
+        are represented by None.
+    '''
+    if os.path.getsize(dump_file) == 0:
+        return None
+    with open(dump_file, 'rb') as dump:
+        return mmap.mmap(dump.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def compare_dumps(dut_dump, ref_dump, context=context_lines):
+    '''
+        Compare the DuT and reference dumps chunk by chunk and stop at the
+        first divergence. Both the files are memory mapped, so only the pages
+        which are actually compared are read from the disk.
+
+        :param dut_dump: Path to the dump generated by the DuT plugin
+
+        :param ref_dump: Path to the dump generated by the reference plugin
+
+        :param context: Number of lines to capture around the mismatch
+
+        :type dut_dump: str
+
+        :type ref_dump: str
+
+        :type context: int
+
+        :returns: None if the dumps match. Else a dict with the ``line`` and
+            byte ``offset`` of the first mismatch and the surrounding lines
+            from the ``dut`` and ``ref`` dumps.
+
+        :rtype: dict
+    '''
+    dut_map = _map(dut_dump)
+    ref_map = _map(ref_dump)
+    try:
+        dut_size = len(dut_map) if dut_map is not None else 0
+        ref_size = len(ref_map) if ref_map is not None else 0
+        common = min(dut_size, ref_size)
+        offset = None
+        for start in range(0, common, chunk_size):
+            end = min(start + chunk_size, common)
+            if dut_map[start:end] != ref_map[start:end]:
+                offset = _first_difference(dut_map, ref_map, start, end)
+                break
+        if offset is None:
+            if dut_size == ref_size:
+                return None
+            # One of the dumps is a prefix of the other
+            offset = common
+        longer = dut_map if dut_size >= ref_size else ref_map
+        return {
+            'line': _line_number(longer, offset),
+            'offset': offset,
+            'dut': _context(dut_map, offset, context),
+            'ref': _context(ref_map, offset, context)
+        }
+    finally:
+        if dut_map is not None:
+            dut_map.close()
+        if ref_map is not None:
+            ref_map.close()
+
+
+def log_mismatch(test, mismatch):
+    '''
+        Log the first divergence recorded for a test.
+
+        :param test: Name of the test
+
+        :param mismatch: Mismatch information returned by :py:func:`compare_dumps`
+
+        :type test: str
+
+        :type mismatch: dict
+    '''
+    logger.error('Test {0}: first mismatch at line {1} (byte offset {2})'.format(
+        test, mismatch['line'], mismatch['offset']))
+    for line in mismatch['dut']:
+        logger.error('  dut: ' + line)
+    for line in mismatch['ref']:
+        logger.error('  ref: ' + line)
+
+
+def compare_test(test, work_dir, dut_dump=None, ref_dump=None):
+    '''
+        Compare the dumps generated for a single test.
+
+        :param test: Name of the test
+
+        :param work_dir: Work directory of the test containing the dumps
+
+        :param dut_dump: Path of the DuT dump, relative to the ``work_dir``.
+            Defaults to ``dut.dump``.
+
+        :param ref_dump: Path of the Reference dump, relative to the
+            ``work_dir``. Defaults to ``ref.dump``.
+
+        :type test: str
+
+        :type work_dir: str
+
+        :type dut_dump: str
+
+        :type ref_dump: str
+
+        :returns: A tuple of the test name, the result (``Passed``, ``Failed``
+            or None if a dump is missing), the mismatch information and the
+            missing dump (``Dut`` or ``Ref``, None if both are present)
+
+        :rtype: tuple
+    '''
+    dut_dump = os.path.join(work_dir, dut_dump or 'dut.dump')
+    ref_dump = os.path.join(work_dir, ref_dump or 'ref.dump')
+    if not os.path.isfile(dut_dump):
+        return test, None, None, 'Dut'
+    if not os.path.isfile(ref_dump):
+        return test, None, None, 'Ref'
+    mismatch = compare_dumps(dut_dump, ref_dump)
+    return test, 'Passed' if mismatch is None else 'Failed', mismatch, None
+
+
+def _compare_batch(batch):
+    return [compare_test(*test) for test in batch]
+
+
+def compare_tests(test_dict, jobs=1, batch_size=None, dumps=None):
+    '''
+        Compare the dumps of all the tests in the test list. With more than
+        one job, the tests are split into batches which are compared across a
+        pool of processes. Results are yielded as and when a batch completes.
+
+        :param test_dict: Test List
+
+        :param jobs: Number of processes to use for comparison
+
+        :param batch_size: Number of tests compared by a process in one go.
+            Derived from the size of the test list if not provided.
+
+        :param dumps: Paths of the DuT and Reference dumps of the tests
+            which do not use the default ones, as (dut, ref) tuples keyed by
+            the test names, see :py:func:`compare_test`
+
+        :type test_dict: dict
+
+        :type jobs: int
+
+        :type batch_size: int
+
+        :type dumps: dict
+
+        :returns: Generator of tuples as returned by :py:func:`compare_test`
+
+        :rtype: generator
+    '''
+    dumps = dumps or {}
+    tests = [(test, attr['work_dir']) + tuple(dumps.get(test, (None, None)))
+             for test, attr in test_dict.items()]
+    if jobs <= 1 or len(tests) <= 1:
+        for test in tests:
+            yield compare_test(*test)
+        return
+
+    if not batch_size:
+        # A few batches per job keeps the workers evenly loaded without
+        # paying the pickling cost for every single test
+        batch_size = max(1, min(256, len(tests) // (jobs * 4)))
+    batches = [
+        tests[start:start + batch_size]
+        for start in range(0, len(tests), batch_size)
+    ]
+    logger.debug('Comparing {0} tests in {1} batches with {2} jobs'.format(
+        len(tests), len(batches), jobs))
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(_compare_batch, batch) for batch in batches]
+        for future in concurrent.futures.as_completed(futures):
+            for result in future.result():
+                yield result
@@ -41,6 +41,18 @@ work_dir:
   check_with: dircheck
 result:
   type: string
+mismatch:
+  type: dict
+  nullable: True
+elf:
+  type: string
+  nullable: True
+timeout:
+  type: integer
+  nullable: True
+rusage:
+  type: dict
+  nullable: True
 compile_macros:
   type: list
   schema:
@@ -94,6 +106,55 @@ open_browser = True
 # Enable Space Saver
 space_saver = True
 
+# Total jobs shared by the generators when more than one is configured
+# gen_jobs = 8
+
+# Number of processes used to validate the generated test list
+validate_jobs = 1
+
+# Build the ELF of each test once and share it with the DuT and Reference plugins
+shared_elf = False
+
+# Number of tests built in parallel when shared_elf is enabled
+build_jobs = 1
+
+# Directory to cache the ELFs in across runs and its size limit in MB
+# elf_cache = ~/.cache/river_core/elf
+elf_cache_size = 1024
+
+# Directory to cache the reference dumps of the ELFs in and its size limit in MB
+# ref_cache = ~/.cache/river_core/ref
+ref_cache_size = 1024
+
+# Record the duration of every test and run the longest tests first
+history = True
+
+# Timeout of a test as a multiple of its longest recent duration, bounded to
+# [timeout_floor, timeout_cap] seconds. Needs history. Disabled if 0
+timeout_factor = 0
+timeout_floor = 30
+timeout_cap = 3600
+# Timeout for the tests without a history, the plugins decide if unset
+# timeout_default = 240
+
+# Address to hand the tests out to `river_core worker` processes from
+# coordinator = localhost:7700
+# Seconds without any worker after which the tests left are unavailable
+# worker_timeout = 600
+
+# Directory, relative to work_dir, to stream the output of every test to.
+# Only the last lines of the output are kept in the reports then
+# test_logs = logs
+
+# Number of processes used to compare the dumps
+compare_jobs = 1
+
+# Write results back to the test list after these many tests (0: only at the end)
+flush_interval = 0
+
+# Also dump the generated test list as a SQLite database (yaml/sqlite)
+test_list_format = yaml
+
 # Coverage Options
 # Enable via True/False
 [coverage]
@@ -0,0 +1,562 @@
+# See LICENSE for details
+"""Distribution of the tests of a run to workers over TCP"""
+import os
+import json
+import time
+import queue
+import errno
+import socket
+import threading
+import collections
+import socketserver
+
+from river_core.log import logger
+from river_core.utils import ProcessLoop, run_test_command
+
+#: Seconds between the heartbeats of a worker
+heartbeat_interval = 5
+#: Seconds without a message after which a worker is considered lost
+heartbeat_timeout = 30
+#: Number of workers a test may be lost with before it is given up
+max_attempts = 3
+#: Seconds between the attempts of a worker to connect to a coordinator
+retry_delay = 1
+#: Seconds a coordinator waits for its address to be free
+listen_timeout = 60
+
+
+def plugin_address(address, kind):
+    '''
+        Get the address on which a plugin distributes its tests when the
+        plugins run concurrently: the DuT on the port after that of the
+        ``coordinator`` and the Reference on the one after that, so that
+        they do not wait on each other for the port.
+
+        :param address: The ``coordinator`` address (``host:port``)
+
+        :param kind: The plugin, ``dut`` or ``ref``
+
+        :type address: str
+
+        :type kind: str
+
+        :returns: The address of the plugin
+
+        :rtype: str
+    '''
+    host, port = parse_address(address)
+    return '{0}:{1}'.format(host, port + {'dut': 1, 'ref': 2}[kind])
+
+
+def parse_address(address):
+    '''
+        Split an address of the form ``host:port``.
+
+        :param address: The address, the host may be left empty
+
+        :type address: str
+
+        :returns: Tuple of the host and the port
+
+        :rtype: tuple
+    '''
+    host, sep, port = str(address).rpartition(':')
+    if not sep or not port.isdigit():
+        logger.error('Invalid address {0}, expected host:port'.format(address))
+        raise SystemExit
+    return host, int(port)
+
+
+def _send(sock, lock, message):
+    data = (json.dumps(message) + '\n').encode()
+    with lock:
+        sock.sendall(data)
+
+
+class _Connection():
+    """State of a worker connected to a :py:class:`Coordinator`."""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.lock = threading.Lock()
+        self.name = None
+        self.slots = 1
+        self.last = time.time()
+        # Tests sent to the worker, which it has not started yet
+        self.assigned = []
+        # Tests the worker is running
+        self.started = set()
+        # Tests asked back from the worker to hand to another one
+        self.revoking = set()
+
+    def load(self):
+        return len(self.assigned) + len(self.started)
+
+    def send(self, message):
+        try:
+            _send(self.sock, self.lock, message)
+        except OSError:
+            # The reader of the connection notices it is gone
+            pass
+
+
+class _Handler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        self.server.coordinator._serve(self.connection, self.rfile)
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class Coordinator():
+    """
+    Hands the tests of a :py:class:`river_core.utils.testRunner` out to the
+    ``river_core worker`` processes connecting to it over TCP. Messages are
+    single line JSON objects in both directions.
+
+    A worker says ``hello`` with the number of tests it runs in parallel and
+    is sent ``job`` messages to fill twice as many, so that it never waits on
+    the coordinator between tests. It reports every test when it ``started``
+    it and sends its ``result`` when it finishes. Once no tests are left to
+    hand out, a worker with an idle slot steals half of the tests another
+    worker has not started yet: that worker is asked to ``revoke`` them and
+    returns the ones it could still take back in a ``revoked`` message.
+
+    Workers send a ``heartbeat`` every ``heartbeat_interval`` seconds. A
+    worker which is silent for ``heartbeat_timeout`` seconds or whose
+    connection drops is lost, and all of its tests are handed out again. A
+    test which was running on ``max_attempts`` lost workers is failed
+    instead, since the test itself is likely bringing the workers down.
+
+    If no worker is connected for ``worker_timeout`` seconds, because none
+    was started or all of them were lost, the tests left are failed as
+    unavailable instead of waiting for a worker forever.
+    """
+
+    #: Seconds without a connected worker after which the tests left are
+    #: failed, set from the ``worker_timeout`` option of the config.ini. 0
+    #: waits forever.
+    worker_timeout = 600
+
+    def __init__(self, address, heartbeat_timeout=heartbeat_timeout,
+                 worker_timeout=None):
+        """Constructor.
+
+        :param address: Address (``host:port``) to listen on, an empty host
+            listens on all the interfaces
+
+        :param heartbeat_timeout: Seconds without a message after which a
+            worker is considered lost
+
+        :param worker_timeout: Seconds without a connected worker after
+            which the tests left are failed. Defaults to
+            :py:attr:`Coordinator.worker_timeout`.
+
+        :type address: str
+
+        :type heartbeat_timeout: int
+
+        :type worker_timeout: int
+        """
+        self.address = parse_address(address)
+        self.heartbeat_timeout = heartbeat_timeout
+        self.worker_timeout = Coordinator.worker_timeout \
+            if worker_timeout is None else worker_timeout
+        self.lock = threading.Lock()
+        self.tests = {}
+        self.pending = collections.deque()
+        self.finished = set()
+        self.attempts = collections.Counter()
+        self.workers = []
+        self.completed = queue.Queue()
+        self.stopped = threading.Event()
+
+    def _listen(self):
+        deadline = time.time() + listen_timeout
+        warned = False
+        while True:
+            try:
+                server = _Server(self.address, _Handler)
+                break
+            except OSError as e:
+                if e.errno != errno.EADDRINUSE:
+                    logger.error('Could not listen on {0}:{1}: {2}'.format(
+                        self.address[0], self.address[1], e))
+                    raise SystemExit
+                # Another run may be distributing its tests on the same
+                # address, give it a while to finish
+                if time.time() > deadline:
+                    logger.error(
+                        '{0}:{1} is still in use after {2}s, set another '
+                        'coordinator port'.format(self.address[0],
+                                                  self.address[1],
+                                                  listen_timeout))
+                    raise SystemExit
+                if not warned:
+                    logger.warning(
+                        '{0}:{1} is in use, waiting for it to be free'.format(
+                            *self.address))
+                    warned = True
+                time.sleep(retry_delay)
+        server.coordinator = self
+        return server
+
+    def run(self, tests):
+        """
+        Distribute the tests and wait for their results.
+
+        :param tests: The tests added to a
+            :py:class:`river_core.utils.testRunner`, dicts of the ``name``,
+            ``command``, ``cwd`` and ``timeout`` of every test
+
+        :type tests: list
+
+        :returns: Generator of (test, result) tuples in the order the tests
+            finish, the result being the same as
+            :py:func:`river_core.utils.run_test_command` returns
+
+        :rtype: generator
+        """
+        self.tests = {test['name']: test for test in tests}
+        self.pending = collections.deque(self.tests)
+        if not self.tests:
+            return
+        server = self._listen()
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        threading.Thread(target=self._monitor, daemon=True).start()
+        logger.info('Waiting for workers on {0}:{1}'.format(*self.address))
+        try:
+            for count in range(len(self.tests)):
+                yield self.completed.get()
+        finally:
+            self.stopped.set()
+            server.shutdown()
+            server.server_close()
+            with self.lock:
+                for worker in self.workers:
+                    try:
+                        worker.sock.shutdown(socket.SHUT_RDWR)
+                    except OSError:
+                        pass
+
+    def _monitor(self):
+        idle_since = time.time()
+        while not self.stopped.wait(1):
+            now = time.time()
+            with self.lock:
+                for worker in self.workers:
+                    if now - worker.last > self.heartbeat_timeout:
+                        logger.warning(
+                            'No heartbeat from worker {0} for {1:.0f}s'.format(
+                                worker.name, now - worker.last))
+                        try:
+                            worker.sock.shutdown(socket.SHUT_RDWR)
+                        except OSError:
+                            pass
+                if self.workers:
+                    idle_since = now
+                elif self.worker_timeout and \
+                        now - idle_since > self.worker_timeout:
+                    self._abandon()
+                    return
+
+    def _abandon(self):
+        left = [name for name in self.tests if name not in self.finished]
+        logger.error('No worker connected for {0}s, {1} tests are '
+                     'unavailable'.format(self.worker_timeout, len(left)))
+        for name in left:
+            self.finished.add(name)
+            self.completed.put((self.tests[name], {
+                'returncode': None,
+                'message': 'Unavailable, no worker for {0}s'.format(
+                    self.worker_timeout),
+                'stdout': '',
+                'stderr': '',
+                'duration': 0
+            }))
+        self.pending.clear()
+
+    def _serve(self, sock, rfile):
+        worker = _Connection(sock)
+        try:
+            for line in rfile:
+                message = json.loads(line)
+                worker.last = time.time()
+                kind = message.get('type')
+                with self.lock:
+                    if kind == 'hello':
+                        worker.name = message.get('worker')
+                        worker.slots = max(1, int(message.get('slots', 1)))
+                        self.workers.append(worker)
+                        logger.info('Worker {0} connected with {1} slots'.format(
+                            worker.name, worker.slots))
+                    elif kind == 'started':
+                        self._started(worker, message['name'])
+                    elif kind == 'result':
+                        self._finish(worker, message['name'],
+                                     message['result'])
+                    elif kind == 'revoked':
+                        self._revoked(worker, message['names'])
+                    self._dispatch()
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning('Dropping worker {0}: {1}'.format(worker.name, e))
+        finally:
+            with self.lock:
+                self._lost(worker)
+                self._dispatch()
+
+    def _started(self, worker, name):
+        if name in worker.assigned:
+            worker.assigned.remove(name)
+        worker.revoking.discard(name)
+        worker.started.add(name)
+
+    def _finish(self, worker, name, result):
+        worker.started.discard(name)
+        if name in self.finished or name not in self.tests:
+            # A late result from a worker which was thought to be lost
+            return
+        self.finished.add(name)
+        self.completed.put((self.tests[name], result))
+
+    def _revoked(self, worker, names):
+        for name in names:
+            if name in worker.assigned:
+                worker.assigned.remove(name)
+        # The rest were started before the worker got the request
+        worker.revoking.clear()
+        self.pending.extendleft(reversed(names))
+
+    def _lost(self, worker):
+        if worker not in self.workers:
+            return
+        self.workers.remove(worker)
+        if not self.stopped.is_set():
+            logger.warning('Lost worker {0}'.format(worker.name))
+        requeue = list(worker.assigned)
+        for name in worker.started:
+            if name in self.finished:
+                continue
+            self.attempts[name] += 1
+            if self.attempts[name] < max_attempts:
+                requeue.append(name)
+                continue
+            self.finished.add(name)
+            self.completed.put((self.tests[name], {
+                'returncode': None,
+                'message': 'Lost with {0} workers'.format(self.attempts[name]),
+                'stdout': '',
+                'stderr': '',
+                'duration': 0
+            }))
+        self.pending.extendleft(reversed(requeue))
+
+    def _dispatch(self):
+        if self.stopped.is_set():
+            return
+        for worker in sorted(self.workers, key=lambda x: x.load() / x.slots):
+            while self.pending and worker.load() < 2 * worker.slots:
+                name = self.pending.popleft()
+                if name in self.finished:
+                    continue
+                test = self.tests[name]
+                worker.assigned.append(name)
+                worker.send({
+                    'type': 'job',
+                    'name': name,
+                    'command': test['command'],
+                    'cwd': test['cwd'],
+                    'timeout': test['timeout']
+                })
+        if self.pending:
+            return
+        for worker in self.workers:
+            if worker.load() >= worker.slots or worker.revoking:
+                continue
+            victim = max(self.workers, key=lambda x: len(x.assigned))
+            if victim is worker or victim.revoking or not victim.assigned:
+                continue
+            names = victim.assigned[len(victim.assigned) // 2:]
+            logger.debug('Stealing {0} tests from worker {1}'.format(
+                len(names), victim.name))
+            victim.revoking.update(names)
+            victim.send({'type': 'revoke', 'names': names})
+
+
+class _Session():
+    """A connection of a worker to a coordinator."""
+
+    def __init__(self, sock, name, jobs, running, loop):
+        self.sock = sock
+        self.name = name
+        self.jobs = jobs
+        # Slots of the worker, shared by the sessions with all the
+        # coordinators it follows
+        self.running = running
+        # Event loop supervising the tests of all the slots
+        self.loop = loop
+        self.lock = threading.Lock()
+        self.condition = threading.Condition()
+        self.queue = collections.deque()
+        self.closed = False
+        self.done = threading.Event()
+        self.ran = 0
+
+    def send(self, message):
+        try:
+            _send(self.sock, self.lock, message)
+        except OSError:
+            pass
+
+    def _heartbeat(self):
+        while not self.done.wait(heartbeat_interval):
+            self.send({'type': 'heartbeat'})
+
+    def _slot(self):
+        while True:
+            with self.condition:
+                while not self.queue and not self.closed:
+                    self.condition.wait()
+                if self.closed:
+                    return
+            with self.running:
+                # The job may have been revoked while waiting for a slot
+                with self.condition:
+                    if self.closed:
+                        return
+                    if not self.queue:
+                        continue
+                    job = self.queue.popleft()
+                self.send({'type': 'started', 'name': job['name']})
+                logger.debug('$ timeout={0} {1}'.format(
+                    job['timeout'], job['command']))
+                result = run_test_command(job['command'],
+                                          job['cwd'],
+                                          job['timeout'],
+                                          loop=self.loop)
+                logger.info('{0}: {1} in {2:.2f}s'.format(
+                    job['name'], result['message'], result['duration']))
+                self.send({
+                    'type': 'result',
+                    'name': job['name'],
+                    'result': result
+                })
+                self.ran += 1
+
+    def serve(self):
+        self.send({'type': 'hello', 'worker': self.name, 'slots': self.jobs})
+        threads = [threading.Thread(target=self._heartbeat, daemon=True)]
+        threads += [
+            threading.Thread(target=self._slot, daemon=True)
+            for slot in range(self.jobs)
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            for line in self.sock.makefile('r'):
+                message = json.loads(line)
+                if message.get('type') == 'job':
+                    with self.condition:
+                        self.queue.append(message)
+                        self.condition.notify()
+                elif message.get('type') == 'revoke':
+                    with self.condition:
+                        names = [
+                            job['name'] for job in self.queue
+                            if job['name'] in message['names']
+                        ]
+                        self.queue = collections.deque(
+                            job for job in self.queue
+                            if job['name'] not in names)
+                    self.send({'type': 'revoked', 'names': names})
+        except (OSError, ValueError) as e:
+            logger.warning('Connection to the coordinator failed: {0}'.format(e))
+        finally:
+            with self.condition:
+                self.closed = True
+                self.condition.notify_all()
+            self.done.set()
+            # Let the running tests finish before connecting again
+            for thread in threads:
+                thread.join()
+        return self.ran
+
+
+def _follow(address, name, jobs, running, loop, idle_timeout):
+    host, port = parse_address(address)
+    idle_since = time.time()
+    ran = 0
+    while True:
+        try:
+            sock = socket.create_connection((host or 'localhost', port),
+                                            timeout=10)
+        except OSError:
+            if idle_timeout and time.time() - idle_since > idle_timeout:
+                logger.info(
+                    'No coordinator at {0} for {1} seconds, ran {2} tests'.
+                    format(address, idle_timeout, ran))
+                return
+            time.sleep(retry_delay)
+            continue
+        sock.settimeout(None)
+        logger.debug('Connected to the coordinator at {0}'.format(address))
+        try:
+            ran += _Session(sock, name, jobs, running, loop).serve()
+        finally:
+            sock.close()
+        idle_since = time.time()
+
+
+def run_worker(addresses, jobs=1, idle_timeout=0):
+    '''
+        Run the tests handed out by a :py:class:`Coordinator`, see the
+        ``worker`` subcommand. The commands of the tests run in the
+        directories of the tests, so the work_dir of river_core has to be at
+        the same path on the worker as on the coordinator. The worker
+        connects to the coordinator again whenever the connection is closed,
+        as happens at the end of every stage of a run.
+
+        A worker may follow several coordinators, such as those of the
+        plugins of a concurrent run (see :py:func:`plugin_address`), in
+        which case at most ``jobs`` tests run at a time over all of them.
+
+        :param addresses: Address (``host:port``) of the coordinator, or a
+            list of them, the host defaults to localhost
+
+        :param jobs: Number of tests to run in parallel
+
+        :param idle_timeout: Exit after this many seconds without a
+            coordinator to connect to, 0 to keep trying forever
+
+        :type addresses: str or list
+
+        :type jobs: int
+
+        :type idle_timeout: int
+    '''
+    if isinstance(addresses, str):
+        addresses = [addresses]
+    for address in addresses:
+        parse_address(address)
+    jobs = max(1, int(jobs))
+    name = '{0}:{1}'.format(socket.gethostname(), os.getpid())
+    logger.info('Worker {0} running {1} tests in parallel for {2}'.format(
+        name, jobs, ', '.join(addresses)))
+    running = threading.BoundedSemaphore(jobs)
+    loop = ProcessLoop()
+    threads = [
+        threading.Thread(target=_follow,
+                         args=(address, name, jobs, running, loop,
+                               idle_timeout),
+                         daemon=True) for address in addresses
+    ]
+    for thread in threads:
+        thread.start()
+    try:
+        for thread in threads:
+            thread.join()
+    finally:
+        loop.close()
@@ -0,0 +1,290 @@
+# See LICENSE for details
+"""Run time history of the tests in a work_dir"""
+import os
+import json
+import heapq
+import tempfile
+
+from river_core.log import logger
+
+#: Number of recent durations kept for every test and plugin
+samples = 5
+
+
+class TestHistory():
+    """
+    Durations of the tests across runs, kept per plugin (``dut``, ``ref``)
+    in ``<work_dir>/.results/history.json``. The last ``samples`` durations
+    are kept, so that a single slow run on a loaded machine does not reorder
+    the whole test list.
+    """
+
+    def __init__(self, work_dir):
+        """Constructor.
+
+        :param work_dir: The work_dir of river_core
+
+        :type work_dir: str
+        """
+        self.path = os.path.join(os.path.abspath(work_dir), '.results',
+                                 'history.json')
+        self.tests = {}
+        self.recorded = set()
+        try:
+            with open(self.path, 'r') as history:
+                self.tests = json.load(history)
+        except (OSError, ValueError):
+            pass
+
+    def __len__(self):
+        return len(self.tests)
+
+    def record(self, kind, outcomes):
+        """
+        Record the durations of a run.
+
+        :param kind: The plugin which ran the tests, ``dut`` or ``ref``
+
+        :param outcomes: Outcome and duration of the tests as returned by
+            :py:func:`river_core.results.report_outcomes`
+
+        :type kind: str
+
+        :type outcomes: dict
+        """
+        for test, outcome in outcomes.items():
+            duration = outcome.get('duration')
+            if duration is None:
+                continue
+            self.recorded.add(test)
+            durations = self.tests.setdefault(test, {}).setdefault(kind, [])
+            durations.append(duration)
+            del durations[:-samples]
+
+    def duration(self, test):
+        """
+        Get the expected duration of a test, the average of its recent
+        durations summed over the plugins.
+
+        :param test: Name of the test
+
+        :type test: str
+
+        :returns: Duration in seconds, None if the test was never run
+
+        :rtype: float
+        """
+        if test not in self.tests:
+            return None
+        return sum(
+            sum(durations) / len(durations)
+            for durations in self.tests[test].values() if durations)
+
+    def longest(self, test):
+        """
+        Get the longest recent duration of a test in any of the plugins.
+
+        :param test: Name of the test
+
+        :type test: str
+
+        :returns: Duration in seconds, None if the test was never run
+
+        :rtype: float
+        """
+        durations = [
+            duration for kind in self.tests.get(test, {}).values()
+            for duration in kind
+        ]
+        return max(durations) if durations else None
+
+    def estimates(self, tests):
+        """
+        Get the expected duration of each of the tests. Tests which were
+        never run are assumed to take the average duration of the rest.
+
+        :param tests: Names of the tests
+
+        :type tests: list
+
+        :returns: Dict of the test name to its expected duration, None if
+            none of the tests were run before
+
+        :rtype: dict
+        """
+        durations = {test: self.duration(test) for test in tests}
+        known = [duration for duration in durations.values()
+                 if duration is not None]
+        if not known:
+            return None
+        average = sum(known) / len(known)
+        return {
+            test: average if duration is None else duration
+            for test, duration in durations.items()
+        }
+
+    def order(self, tests):
+        """
+        Order the tests longest first, which keeps the parallel jobs busy
+        till the end of the run.
+
+        :param tests: Names of the tests
+
+        :type tests: list
+
+        :returns: The tests ordered by their expected duration
+
+        :rtype: list
+        """
+        durations = self.estimates(tests)
+        if durations is None:
+            return list(tests)
+        return sorted(tests, key=lambda test: durations[test], reverse=True)
+
+    def save(self, path=None):
+        """
+        Write the durations recorded by this run back atomically. Tests
+        recorded by other runs in the meantime are kept.
+
+        :param path: File to write to instead of ``history.json``. The
+            shards of a regression write their durations to a file of their
+            own, so that the history all of them partition the tests with
+            stays the same till the results are gathered.
+
+        :type path: str
+        """
+        path = path or self.path
+        try:
+            with open(path, 'r') as history:
+                tests = json.load(history)
+        except (OSError, ValueError):
+            tests = {}
+        for test in self.recorded:
+            tests[test] = self.tests[test]
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_file = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, 'w') as history:
+            json.dump(tests, history)
+        os.chmod(tmp_file, 0o644)
+        os.replace(tmp_file, path)
+        logger.debug('Saved the durations of {0} tests to {1}'.format(
+            len(self.recorded), path))
+        self.recorded = set()
+
+    def merge(self, path):
+        """
+        Take over the durations saved by a shard to a file of its own.
+
+        :param path: File written by :py:meth:`save`
+
+        :type path: str
+        """
+        try:
+            with open(path, 'r') as history:
+                tests = json.load(history)
+        except (OSError, ValueError):
+            logger.warning('Could not read the durations in ' + path)
+            return
+        self.tests.update(tests)
+        self.recorded.update(tests)
+
+
+def shard_tests(tests, index, count, history=None):
+    '''
+        Pick the tests of one of ``count`` shards of a regression. The
+        partition only depends on the names of the tests and the history, so
+        every shard computes the same one independently. With a history, the
+        tests are dealt longest first to the shard with the least total
+        duration so far, else every ``count``-th test by name goes to a
+        shard.
+
+        :param tests: Names of all the tests
+
+        :param index: The shard to pick, from 1 to ``count``
+
+        :param count: Number of shards
+
+        :param history: Durations of the tests
+
+        :type tests: list
+
+        :type index: int
+
+        :type count: int
+
+        :type history: TestHistory
+
+        :returns: Names of the tests in the shard, in the order of ``tests``
+
+        :rtype: list
+    '''
+    names = sorted(tests)
+    durations = history.estimates(names) if history else None
+    if durations is None:
+        picked = set(names[index - 1::count])
+    else:
+        loads = [(0.0, shard) for shard in range(count)]
+        picked = set()
+        for test in sorted(names, key=lambda test: (-durations[test], test)):
+            load, shard = heapq.heappop(loads)
+            if shard == index - 1:
+                picked.add(test)
+            heapq.heappush(loads, (load + durations[test], shard))
+    return [test for test in tests if test in picked]
+
+
+class TimeoutPolicy():
+    """
+    Per-test timeouts derived from the history of the tests. The timeout of
+    a test is its longest recent duration scaled by ``factor``, bounded to
+    ``[floor, cap]``. Tests without a history, or all the tests if the
+    durations are not recorded, get the ``default`` timeout.
+    """
+
+    def __init__(self, history, factor=3.0, floor=30, cap=3600, default=None):
+        """Constructor.
+
+        :param history: Durations of the tests, None if they are not recorded
+
+        :param factor: Multiple of the longest recent duration to allow
+
+        :param floor: Lower bound of a timeout in seconds
+
+        :param cap: Upper bound of a timeout in seconds
+
+        :param default: Timeout of the tests without a history. None leaves
+            it to the plugins.
+
+        :type history: TestHistory
+
+        :type factor: float
+
+        :type floor: int
+
+        :type cap: int
+
+        :type default: int
+        """
+        self.history = history
+        self.factor = factor
+        self.floor = floor
+        self.cap = cap
+        self.default = default
+
+    def timeout(self, test):
+        """
+        Get the timeout of a test.
+
+        :param test: Name of the test
+
+        :type test: str
+
+        :returns: Timeout in whole seconds
+
+        :rtype: int
+        """
+        longest = self.history.longest(test) \
+            if self.history is not None else None
+        if longest is None:
+            return self.default
+        return int(min(self.cap, max(self.floor, self.factor * longest)) + 0.5)
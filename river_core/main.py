@@ -5,7 +5,7 @@ import click
 import os
 
 from river_core.log import *
-from river_core.rivercore import rivercore_clean, rivercore_compile, rivercore_generate, rivercore_merge, rivercore_setup
+from river_core.rivercore import rivercore_clean, rivercore_compile, rivercore_generate, rivercore_merge, rivercore_setup, rivercore_convert, rivercore_cache, rivercore_gather, rivercore_worker
 from river_core.__init__ import __version__
 import river_core.constants as constants
 
@@ -143,9 +143,41 @@ def setup(config, dut, gen, ref, verbosity):
     '--coverage',
     is_flag=True,
     help='Enable collection of coverage statistics from the DuT plugin')
+@click.option(
+    '--concurrent',
+    is_flag=True,
+    help=
+    'Run the stages of the DuT and the Reference plugins concurrently, each in a process of its own'
+)
+@click.option(
+    '--resume',
+    is_flag=True,
+    help=
+    'Only run the tests which do not have a Passed or Failed result in the test list yet'
+)
+@click.option(
+    '--only',
+    multiple=True,
+    metavar='failed|timeout|unavailable|GLOB',
+    help=
+    'Only run the tests with a Failed or Timeout result, without a result or with names matching a glob. Can be given more than once'
+)
+@click.option(
+    '--shard',
+    metavar='I/N',
+    help=
+    'Only run the I-th of N shards of the test list. Gather the results of the shards with the gather subcommand'
+)
+@click.option(
+    '--pipeline',
+    type=click.IntRange(min=1),
+    metavar='N',
+    help=
+    'Stream the tests in batches of N through the ELF build, the DuT and Reference plugins and the comparison, with the stages working on different batches at the same time'
+)
 @cli.command()
 def compile(config, test_list, coverage, verbosity, dut_stage, ref_stage,
-            compare):
+            compare, concurrent, resume, only, shard, pipeline):
     '''
         subcommand to compile generated programs.
     '''
@@ -174,8 +206,17 @@ def compile(config, test_list, coverage, verbosity, dut_stage, ref_stage,
                 logger.warning(
                     'Compare is enabled\nThis will be generating incomplete reports'
                 )
+    if shard:
+        try:
+            shard = tuple(int(x) for x in shard.split('/'))
+            if len(shard) != 2 or not 1 <= shard[0] <= shard[1]:
+                raise ValueError
+        except ValueError:
+            logger.error('Shard should be I/N with 1 <= I <= N')
+            raise SystemExit
     rivercore_compile(config, test_list, coverage, verbosity, dut_stage,
-                      ref_stage, compare)
+                      ref_stage, compare, concurrent, resume, only, shard,
+                      pipeline)
 
 
 @click.version_option(version=__version__)
@@ -190,15 +231,20 @@ def compile(config, test_list, coverage, verbosity, dut_stage, ref_stage,
     help=
     'Read option defaults from the INI file\nAuto detects river_core.ini in current directory or in the ~ directory'
 )
+@click.option(
+    '--concurrent',
+    is_flag=True,
+    help=
+    'Run the generators concurrently, each in a process of its own')
 @cli.command()
-def generate(config, verbosity):
+def generate(config, verbosity, concurrent):
     """
     subcommand to generate programs.
     """
     logger.info(constants.header_temp.format(__version__))
     if not config:
         config = check_config()
-    rivercore_generate(config, verbosity)
+    rivercore_generate(config, verbosity, concurrent)
 
 
 @click.version_option(version=__version__)
@@ -226,5 +272,107 @@ def merge(verbosity, db_files, output, config):
     rivercore_merge(verbosity, db_files, output, config)
 
 
+@click.version_option(version=__version__)
+@click.option('-v',
+              '--verbosity',
+              default='info',
+              help='set the verbosity level for the framework')
+@click.argument('src', nargs=1, type=click.Path(dir_okay=False, exists=True))
+@click.argument('dest', nargs=1, type=click.Path(dir_okay=False))
+@cli.command()
+def convert(verbosity, src, dest):
+    """
+    subcommand to convert a test list between YAML and SQLite (.db) formats.
+    """
+    logger.info(constants.header_temp.format(__version__))
+    rivercore_convert(src, dest, verbosity)
+
+
+@click.version_option(version=__version__)
+@click.option(
+    '-c',
+    '--config',
+    type=click.Path(dir_okay=False, exists=True),
+    help=
+    'Read option defaults from the INI file\nAuto detects river_core.ini in current directory or in the ~ directory'
+)
+@click.option('-v',
+              '--verbosity',
+              default='info',
+              help='set the verbosity level for the framework')
+@click.option('-t',
+              '--test_list',
+              type=click.Path(dir_okay=False, exists=True),
+              help='Test List the shards were run from',
+              required=True)
+@click.argument('work_dirs', nargs=-1, type=click.Path(file_okay=False,
+                                                       exists=True))
+@cli.command()
+def gather(config, verbosity, test_list, work_dirs):
+    """
+    subcommand to gather the results of the shards of a regression.
+    """
+    logger.info(constants.header_temp.format(__version__))
+    if not config:
+        config = check_config()
+    rivercore_gather(config, test_list, work_dirs, verbosity)
+
+
+@click.version_option(version=__version__)
+@click.option(
+    '-c',
+    '--config',
+    type=click.Path(dir_okay=False, exists=True),
+    help=
+    'Read option defaults from the INI file\nAuto detects river_core.ini in current directory or in the ~ directory'
+)
+@click.option('-v',
+              '--verbosity',
+              default='info',
+              help='set the verbosity level for the framework')
+@click.option('--clear',
+              is_flag=True,
+              help='Remove all the entries from the caches')
+@cli.command()
+def cache(config, clear, verbosity):
+    """
+    subcommand to show the statistics of the build caches or clear them.
+    """
+    logger.info(constants.header_temp.format(__version__))
+    if not config:
+        config = check_config()
+    rivercore_cache(config, clear, verbosity)
+
+
+@click.version_option(version=__version__)
+@click.option('-v',
+              '--verbosity',
+              default='info',
+              help='set the verbosity level for the framework')
+@click.option('-j',
+              '--jobs',
+              type=click.IntRange(min=1),
+              default=1,
+              show_default=True,
+              help='Number of tests to run in parallel')
+@click.option('--idle-timeout',
+              type=click.IntRange(min=0),
+              default=0,
+              help='Exit after these many seconds without a coordinator, '
+              '0 to wait forever')
+@click.argument('address', nargs=-1, required=True)
+@cli.command()
+def worker(verbosity, jobs, idle_timeout, address):
+    """
+    subcommand to run the tests handed out by a coordinator.
+
+    ADDRESS is the coordinator option in the config.ini of the run, as
+    host:port. Add the two ports after it to also run the tests of the
+    plugins of compile --concurrent and --pipeline runs.
+    """
+    logger.info(constants.header_temp.format(__version__))
+    rivercore_worker(address, jobs, idle_timeout, verbosity)
+
+
 if __name__ == '__main__':
     cli()
@@ -0,0 +1,121 @@
+# See LICENSE for details
+"""Streaming of batches of tests through the stages of a run"""
+import queue
+import threading
+
+#: Number of batches which may wait between two stages of a pipeline
+default_depth = 1
+
+# Marks the end of the batches in a queue
+_end = object()
+
+
+def split_batches(tests, size):
+    '''
+        Split a list of tests into batches.
+
+        :param tests: Names of the tests
+
+        :param size: Number of tests in a batch
+
+        :type tests: list
+
+        :type size: int
+
+        :returns: The batches, in the order of ``tests``
+
+        :rtype: list
+    '''
+    size = max(1, int(size))
+    return [tests[start:start + size] for start in range(0, len(tests), size)]
+
+
+def run_pipeline(items, stages, depth=default_depth):
+    '''
+        Pass items through a chain of stages. Every stage runs in a thread
+        of its own and hands what it returns on to the next stage through a
+        queue which holds at most ``depth`` items. A stage works on the next
+        item while the later stages are still busy with the earlier ones,
+        and a slow stage holds back the stages before it instead of letting
+        work pile up in between.
+
+        If a stage raises, including the ``SystemExit`` raised on errors in
+        river_core, all the stages stop after the item they are working on
+        and the exception is raised again here.
+
+        :param items: The items to feed to the first stage
+
+        :param stages: Functions taking the output of the previous stage
+
+        :param depth: Number of items which may wait between two stages
+
+        :type items: iterable
+
+        :type stages: list
+
+        :type depth: int
+
+        :returns: What the last stage returned for every item, in the order
+            of ``items``
+
+        :rtype: list
+    '''
+    queues = [queue.Queue(maxsize=max(1, depth)) for stage in stages]
+    queues.append(queue.Queue())
+    failed = threading.Event()
+    errors = []
+
+    def put(target, item):
+        while not failed.is_set():
+            try:
+                target.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def get(source):
+        while not failed.is_set():
+            try:
+                return source.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        return _end
+
+    def feed():
+        for item in items:
+            if not put(queues[0], item):
+                return
+        put(queues[0], _end)
+
+    def work(stage, inbox, outbox):
+        try:
+            while True:
+                item = get(inbox)
+                if item is _end:
+                    break
+                if not put(outbox, stage(item)):
+                    return
+            put(outbox, _end)
+        except BaseException as exc:
+            errors.append(exc)
+            failed.set()
+
+    threads = [threading.Thread(target=feed, daemon=True)]
+    threads += [
+        threading.Thread(target=work,
+                         args=(stage, queues[index], queues[index + 1]),
+                         daemon=True) for index, stage in enumerate(stages)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+    results = []
+    while True:
+        item = queues[-1].get()
+        if item is _end:
+            return results
+        results.append(item)
@@ -0,0 +1,345 @@
+# See LICENSE for details
+"""Result bookkeeping for the tests in a test list"""
+import os
+import json
+import datetime
+
+from river_core.log import logger
+from river_core.testlist import save_test_list
+
+#: Fields of a journal record which are folded back into the test list
+test_list_fields = ('result', 'mismatch', 'rusage')
+#: Results of the tests which ran to completion
+final_results = ('Passed', 'Failed', 'Timeout')
+#: Results of the tests which --resume does not run again. Tests which timed
+#: out are run again, typically with a larger timeout.
+resumed_results = ('Passed', 'Failed')
+#: Number of tests listed per generator in the resource usage of a report
+heaviest_tests = 10
+
+
+def _properties(entry):
+    return dict(
+        prop for prop in entry.get('user_properties') or []
+        if isinstance(prop, (list, tuple)) and len(prop) == 2)
+
+
+def _timed_out(entry):
+    '''
+        Check if a failed test in a report log was killed on a timeout, from
+        the ``timeout`` flag which :py:func:`river_core.utils.report_entry`
+        records in its ``user_properties``.
+    '''
+    if entry.get('outcome') != 'failed':
+        return False
+    return bool(_properties(entry).get('timeout'))
+
+
+def report_outcomes(json_data):
+    '''
+        Extract the outcome, duration and resource usage of every test from
+        a pytest report log. The plugins parametrize their tests with commands which end in
+        the name of the test (the make target), so the last word of the test
+        id is taken as the name of the test.
+
+        :param json_data: Entries of the report log
+
+        :type json_data: list
+
+        :returns: Dict of the test name to its ``outcome``, ``duration``,
+            whether it hit a ``timeout``, and its ``rusage`` and the path of
+            its ``dump`` if the report has them, see
+            :py:func:`river_core.utils.run_process` and
+            :py:class:`river_core.simpool.SimWorker`
+
+        :rtype: dict
+    '''
+    outcomes = {}
+    for entry in json_data:
+        if entry.get('$report_type', None) != 'TestReport' or \
+                entry.get('when', None) != 'call':
+            continue
+        nodeid = entry['nodeid']
+        if '[' in nodeid:
+            nodeid = nodeid[nodeid.index('[') + 1:].rstrip(']')
+        words = nodeid.split()
+        if not words:
+            continue
+        outcomes[words[-1]] = {
+            'outcome': entry.get('outcome'),
+            'duration': entry.get('duration'),
+            'timeout': _timed_out(entry),
+            'rusage': _properties(entry).get('rusage'),
+            'dump': _properties(entry).get('dump')
+        }
+    return outcomes
+
+
+def resource_usage(test_dict, count=heaviest_tests):
+    '''
+        Aggregate the resource usage recorded in the test list per
+        generator. The usage of a test is summed over the plugins which ran
+        it, except for the peak memory, which is the largest of them.
+
+        :param test_dict: The loaded test list
+
+        :param count: Number of the heaviest tests to list per generator
+
+        :type test_dict: dict
+
+        :type count: int
+
+        :returns: Dict of the generator to the number of ``tests`` with a
+            recorded usage, their total ``utime``, ``stime`` and ``wall``
+            time, the largest ``maxrss`` and the ``heaviest`` tests by CPU
+            time as (name, usage) tuples
+
+        :rtype: dict
+    '''
+    usage = {}
+    for test, attr in test_dict.items():
+        plugins = [
+            rusage for rusage in (attr.get('rusage') or {}).values()
+            if rusage
+        ]
+        if not plugins:
+            continue
+        total = {
+            'utime': sum(rusage.get('utime', 0) for rusage in plugins),
+            'stime': sum(rusage.get('stime', 0) for rusage in plugins),
+            'maxrss': max(rusage.get('maxrss') or 0 for rusage in plugins),
+            'wall': sum(rusage.get('wall', 0) for rusage in plugins)
+        }
+        total['cpu'] = total['utime'] + total['stime']
+        generator = usage.setdefault(
+            attr.get('generator', 'unknown'), {
+                'tests': 0,
+                'utime': 0,
+                'stime': 0,
+                'maxrss': 0,
+                'wall': 0,
+                'heaviest': []
+            })
+        generator['tests'] += 1
+        for field in ('utime', 'stime', 'wall'):
+            generator[field] += total[field]
+        generator['maxrss'] = max(generator['maxrss'], total['maxrss'])
+        generator['heaviest'].append((test, total))
+    for generator in usage.values():
+        generator['heaviest'] = sorted(
+            generator['heaviest'],
+            key=lambda item: item[1]['cpu'],
+            reverse=True)[:count]
+    return usage
+
+
+def _apply_records(records, test_dict):
+    count = 0
+    for test, record in records.items():
+        if test not in test_dict:
+            continue
+        for field in test_list_fields:
+            if record.get(field) is None:
+                test_dict[test].pop(field, None)
+            else:
+                test_dict[test][field] = record[field]
+        count += 1
+    return count
+
+
+def merge_journals(journals, test_dict):
+    '''
+        Fold the results from several journals, such as those of the shards
+        of a regression, into a test list. When more than one journal has a
+        record for a test, the most recent one is taken.
+
+        :param journals: The journals to merge
+
+        :param test_dict: The loaded test list to update
+
+        :type journals: list
+
+        :type test_dict: dict
+
+        :returns: Number of tests updated
+
+        :rtype: int
+    '''
+    latest = {}
+    for journal in journals:
+        for test, record in journal.latest().items():
+            if test not in latest or \
+                    record.get('time', '') >= latest[test].get('time', ''):
+                latest[test] = record
+    return _apply_records(latest, test_dict)
+
+
+class ResultStore():
+    """
+    Buffers the result updates of the tests in memory and writes the test
+    list back in one go, either when :py:meth:`flush` is called or once
+    ``flush_interval`` updates are pending. YAML test lists are rewritten
+    atomically, SQLite test lists only get the updated rows.
+    """
+
+    def __init__(self, test_list, test_dict, flush_interval=0, journal=None):
+        """Constructor.
+
+        :param test_list: Path to the test list to write back to
+
+        :param test_dict: The loaded test list which receives the updates
+
+        :param flush_interval: Number of updates after which the test list
+            is written back. 0 writes only on an explicit flush.
+
+        :param journal: Journal to which every update is appended
+
+        :type test_list: str
+
+        :type test_dict: dict
+
+        :type flush_interval: int
+
+        :type journal: ResultJournal
+        """
+        self.test_list = test_list
+        self.test_dict = test_dict
+        self.flush_interval = flush_interval
+        self.journal = journal
+        self.pending = 0
+        self.dirty = set()
+
+    def update(self, test, **fields):
+        """
+        Update the fields of a test. Only the fields listed in
+        ``test_list_fields`` end up in the test list, a field set to None is
+        removed from the test entry. All the fields are recorded in the
+        journal.
+
+        :param test: Name of the test
+
+        :param fields: Fields to update for the test
+
+        :type test: str
+        """
+        if self.journal is not None:
+            self.journal.append(test, **fields)
+        entry = self.test_dict[test]
+        for field, value in fields.items():
+            if field not in test_list_fields:
+                continue
+            if value is None:
+                entry.pop(field, None)
+            else:
+                entry[field] = value
+        self.dirty.add(test)
+        self.pending += 1
+        if self.flush_interval and self.pending >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """
+        Write the test list back atomically if there are pending updates.
+        """
+        if not self.pending:
+            return
+        logger.debug('Writing {0} result updates to {1}'.format(
+            self.pending, self.test_list))
+        save_test_list(self.test_dict, self.test_list, self.dirty)
+        self.dirty = set()
+        self.pending = 0
+
+
+class ResultJournal():
+    """
+    Append-only JSONL journal of the test results, kept under
+    ``<work_dir>/.results/``. Every record is written with a single
+    ``write`` on a file opened in append mode, so records from different
+    processes do not interleave and a crash loses at most the record being
+    written.
+    """
+
+    def __init__(self, work_dir, name='journal'):
+        """Constructor.
+
+        :param work_dir: The work_dir of river_core
+
+        :param name: Name of the journal file without the extension
+
+        :type work_dir: str
+
+        :type name: str
+        """
+        self.results_dir = os.path.join(os.path.abspath(work_dir), '.results')
+        os.makedirs(self.results_dir, exist_ok=True)
+        self.path = os.path.join(self.results_dir, name + '.jsonl')
+
+    def append(self, test, **record):
+        """
+        Append a record for a test to the journal.
+
+        :param test: Name of the test
+
+        :param record: Fields to record for the test
+
+        :type test: str
+        """
+        record['test'] = test
+        record['time'] = datetime.datetime.now().isoformat()
+        line = (json.dumps(record) + '\n').encode()
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+
+    def records(self):
+        """
+        Read back all the records in the journal. A truncated last record,
+        as left behind by a crash, is skipped.
+
+        :returns: Generator of the records in the order they were appended
+
+        :rtype: generator
+        """
+        if not os.path.isfile(self.path):
+            return
+        with open(self.path, 'r') as journal:
+            for line in journal:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    logger.warning('Skipping corrupt record in ' + self.path)
+
+    def latest(self):
+        """
+        Get the most recent record of every test in the journal.
+
+        :rtype: dict
+        """
+        latest = {}
+        for record in self.records():
+            latest[record['test']] = record
+        return latest
+
+    def compact(self, test_dict):
+        """
+        Fold the latest record of every test in the journal back into the
+        test list.
+
+        :param test_dict: The loaded test list to update
+
+        :type test_dict: dict
+
+        :returns: Number of tests updated
+
+        :rtype: int
+        """
+        return _apply_records(self.latest(), test_dict)
+
+    def clear(self):
+        """
+        Remove all the records from the journal.
+        """
+        if os.path.isfile(self.path):
+            os.remove(self.path)
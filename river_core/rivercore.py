@@ -7,11 +7,29 @@ import shutil
 import datetime
 import importlib
 import configparser
-import filecmp
 import json
+import multiprocessing
+import fnmatch
+import time
+import traceback
+import concurrent.futures
 
 from river_core.log import *
 import river_core.utils as utils
+from river_core.compare import compare_tests, log_mismatch
+from river_core.results import ResultStore, ResultJournal, report_outcomes
+from river_core.results import final_results, resumed_results
+from river_core.results import merge_journals
+from river_core.results import resource_usage
+from river_core.testlist import load_test_list, save_test_list, TestListDB
+from river_core.testlist import convert_test_list, is_db
+from river_core.validate import validate_test_list
+from river_core.build import build_elfs
+from river_core.cache import ElfCache, RefCache
+from river_core.history import TestHistory, TimeoutPolicy, shard_tests
+from river_core.distributed import Coordinator, plugin_address, run_worker
+from river_core.pipeline import run_pipeline, split_batches
+from river_core.simpool import SimPool
 from river_core.constants import *
 from river_core.__init__ import __version__
 from river_core.sim_hookspecs import *
@@ -48,6 +66,25 @@ def sanitise_pytest_json(json):
     return return_data
 
 
+def load_pytest_json(json_file):
+    '''
+        Function to load a JSON report log generated by pytest.
+
+        :param json_file: Path to the report log
+
+        :type json_file: str
+
+        :return: A list with one entry per line of the report log
+
+        :rtype: list
+    '''
+    json_data = []
+    with open(json_file, 'r') as report_log:
+        for line in report_log:
+            json_data.append(json.loads(line))
+    return json_data
+
+
 def generate_coverage_report(output_dir, config, coverage_report,
                              coverage_rank_report, db_files):
     '''
@@ -158,13 +195,15 @@ def generate_report(output_dir, gen_json_data, target_json_data, ref_json_data,
 
     ## Get the proper stats about passed and failed test
     # NOTE: This is the place where you determine when your test passed fail, just add extra things to compare in the if condition if the results become to high
-    num_passed = num_total = num_unav = num_failed = 0
+    num_passed = num_total = num_unav = num_failed = num_timeout = 0
     for test in test_dict:
         num_total = num_total + 1
         try:
             if test_dict[test]['result'] == 'Unavailable':
                 num_unav = num_unav + 1
                 continue
+            elif test_dict[test]['result'] == 'Timeout':
+                num_timeout = num_timeout + 1
             elif test_dict[test]['result'] == 'Passed':
                 num_passed = num_passed + 1
             else:
@@ -193,6 +232,8 @@ def generate_report(output_dir, gen_json_data, target_json_data, ref_json_data,
     html_objects['num_passed'] = num_passed
     html_objects['num_failed'] = num_failed
     html_objects['num_unav'] = num_unav
+    html_objects['num_timeout'] = num_timeout
+    html_objects['resource_usage'] = resource_usage(test_dict)
 
     if not os.path.exists(report_dir):
         os.makedirs(report_dir)
@@ -213,6 +254,879 @@ def generate_report(output_dir, gen_json_data, target_json_data, ref_json_data,
     return report_file_path
 
 
+def _run_plugin_stages(pm, stage, init_kwargs, module_dir):
+    '''
+        Run the stages of a DuT/Reference plugin up to the requested stage.
+
+        :param pm: Plugin manager with the plugin registered
+
+        :param stage: Last stage to run (init, build or run)
+
+        :param init_kwargs: Arguments for the init hook
+
+        :param module_dir: Path to the plugin modules, passed to the run hook
+
+        :type pm: pluggy.PluginManager
+
+        :type stage: str
+
+        :type init_kwargs: dict
+
+        :type module_dir: str
+
+        :return: Value returned by the run hook, None if it was not run
+
+        :rtype: list
+    '''
+    logger.debug('Running stages up to {0}'.format(stage))
+    pm.hook.init(**init_kwargs)
+    if stage == 'init':
+        return None
+    return _run_test_stages(pm, stage, init_kwargs, module_dir)
+
+
+def _run_test_stages(pm, stage, init_kwargs, module_dir):
+    '''
+        Run the stages of a DuT/Reference plugin after the init stage, up to
+        the requested stage.
+
+        :param pm: Plugin manager with the plugin registered
+
+        :param stage: Last stage to run (build or run)
+
+        :param init_kwargs: Arguments for the init hook, with the test list
+            the plugin was last given
+
+        :param module_dir: Path to the plugin modules, passed to the run hook
+
+        :type pm: pluggy.PluginManager
+
+        :type stage: str
+
+        :type init_kwargs: dict
+
+        :type module_dir: str
+
+        :return: Value returned by the run hook, None if it was not run
+
+        :rtype: list
+    '''
+    pm.hook.build()
+    if stage == 'build':
+        return None
+    if pm.hook.worker_command.get_hookimpls():
+        return _run_sim_pool(pm, init_kwargs)
+    if pm.hook.run_batch.get_hookimpls():
+        return _run_batches(pm, init_kwargs, module_dir)
+    return pm.hook.run(module_dir=module_dir)
+
+
+def _init_plugin(pm, init_kwargs):
+    '''
+        Run the init stage of a DuT/Reference plugin ahead of the batches of
+        a pipeline, if the plugin takes the tests of every batch through its
+        load_tests hook.
+
+        :param pm: Plugin manager with the plugin registered
+
+        :param init_kwargs: Arguments for the init hook
+
+        :type pm: pluggy.PluginManager
+
+        :type init_kwargs: dict
+
+        :return: True if the init stage was run, False if the plugin needs
+            it for every batch
+
+        :rtype: bool
+    '''
+    if not pm.hook.load_tests.get_hookimpls():
+        return False
+    pm.hook.init(**init_kwargs)
+    return True
+
+
+def _run_batch_stages(pm, stage, init_kwargs, module_dir, test_list):
+    '''
+        Run the stages of a DuT/Reference plugin on a batch of a pipeline.
+        A plugin implementing the load_tests hook is handed the batch
+        through it, the others go through their init stage again.
+
+        :param pm: Plugin manager with the plugin registered
+
+        :param stage: Last stage to run (build or run)
+
+        :param init_kwargs: Arguments for the init hook
+
+        :param module_dir: Path to the plugin modules, passed to the run hook
+
+        :param test_list: Test List of the batch
+
+        :type pm: pluggy.PluginManager
+
+        :type stage: str
+
+        :type init_kwargs: dict
+
+        :type module_dir: str
+
+        :type test_list: str
+
+        :return: Value returned by the run hook
+
+        :rtype: list
+    '''
+    init_kwargs = dict(init_kwargs, test_list=test_list)
+    if not pm.hook.load_tests.get_hookimpls():
+        return _run_plugin_stages(pm, stage, init_kwargs, module_dir)
+    pm.hook.load_tests(test_list=test_list)
+    return _run_test_stages(pm, stage, init_kwargs, module_dir)
+
+
+def _run_sim_pool(pm, init_kwargs):
+    '''
+        Run the tests of a plugin on a pool of simulator workers started with
+        the command from its worker_command hook, see
+        :py:class:`river_core.simpool.SimPool`.
+
+        :param pm: Plugin manager with the plugin registered
+
+        :param init_kwargs: Arguments the init hook was called with
+
+        :type pm: pluggy.PluginManager
+
+        :type init_kwargs: dict
+
+        :return: Path of the report without the extension, in a list like
+            the value returned by the run hook
+
+        :rtype: list
+    '''
+    ini_config = init_kwargs['ini_config']
+    # Tests without a timeout in the test list get the same default as the
+    # ones run by utils.testRunner
+    timeout = ini_config.parser['river_core'].getint('timeout_default',
+                                                     fallback=240)
+    json_dir = os.path.join(init_kwargs['work_dir'], '.json')
+    os.makedirs(json_dir, exist_ok=True)
+    report_file = os.path.join(
+        json_dir, '{0}_pool_{1}'.format(
+            ini_config.name,
+            datetime.datetime.now().strftime("%Y%m%d-%H%M")))
+    pool = SimPool(pm.hook.worker_command(),
+                   jobs=int(ini_config.get('jobs', 1)),
+                   max_tests=int(ini_config.get('worker_tests', 0)),
+                   cwd=init_kwargs['work_dir'],
+                   timeout=timeout)
+    pool.execute(load_test_list(init_kwargs['test_list']),
+                 report_file + '.json')
+    return [report_file]
+
+
+def _run_batches(pm, init_kwargs, module_dir):
+    '''
+        Run the tests of a plugin through its run_batch hook. The tests are
+        split into batches of ``batch_size`` tests, one batch per job by
+        default, and up to ``jobs`` batches run at a time.
+
+        :param pm: Plugin manager with the plugin registered
+
+        :param init_kwargs: Arguments the init hook was called with
+
+        :param module_dir: Path to the plugin modules, passed to the hook
+
+        :type pm: pluggy.PluginManager
+
+        :type init_kwargs: dict
+
+        :type module_dir: str
+
+        :return: Path of the report without the extension, in a list like
+            the value returned by the run hook
+
+        :rtype: list
+    '''
+    ini_config = init_kwargs['ini_config']
+    test_dict = load_test_list(init_kwargs['test_list'])
+    jobs = max(1, int(ini_config.get('jobs', 1)))
+    batch_size = int(ini_config.get('batch_size', 0)) or max(
+        1, -(-len(test_dict) // jobs))
+    batches = split_batches(list(test_dict), batch_size)
+    logger.info('Running {0} tests in {1} batches with {2} jobs'.format(
+        len(test_dict), len(batches), jobs))
+    json_dir = os.path.join(init_kwargs['work_dir'], '.json')
+    os.makedirs(json_dir, exist_ok=True)
+    report_file = os.path.join(
+        json_dir, '{0}_batch_{1}'.format(
+            ini_config.name,
+            datetime.datetime.now().strftime("%Y%m%d-%H%M")))
+
+    def run_batch(tests):
+        start = time.time()
+        results = pm.hook.run_batch(
+            tests={test: test_dict[test] for test in tests},
+            module_dir=module_dir)
+        return results or {}, time.time() - start
+
+    passed = 0
+    with open(report_file + '.json', 'w') as report, \
+            concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as pool:
+        futures = {pool.submit(run_batch, tests): tests for tests in batches}
+        for future in concurrent.futures.as_completed(futures):
+            results, duration = future.result()
+            for test in futures[future]:
+                result = {
+                    'returncode': None,
+                    'message': 'Not run by the batch',
+                    'stdout': '',
+                    'stderr': '',
+                    'duration': duration / len(futures[future])
+                }
+                if test in results:
+                    result['message'] = 'Exited with {0}'.format(
+                        results[test].get('returncode'))
+                    result.update(results[test])
+                entry = utils.report_entry(
+                    {
+                        'name': test,
+                        'command': 'run_batch',
+                        'cwd': test_dict[test]['work_dir']
+                    }, result)
+                report.write(json.dumps(entry) + '\n')
+                if entry['outcome'] == 'passed':
+                    passed += 1
+                else:
+                    logger.error('{0} failed: {1}'.format(
+                        test, result['message']))
+            report.flush()
+    logger.info('{0} of {1} tests passed'.format(passed, len(test_dict)))
+    return [report_file]
+
+
+def _run_generator_stages(pm, spec_config, module_dir, output_dir):
+    '''
+        Run the pre_gen, gen and post_gen stages of a Generator plugin.
+
+        :param pm: Plugin manager with the generator registered
+
+        :param spec_config: Config section of the generator
+
+        :param module_dir: Path to the generator plugins
+
+        :param output_dir: The work_dir of river_core
+
+        :type pm: pluggy.PluginManager
+
+        :type spec_config: configparser.SectionProxy
+
+        :type module_dir: str
+
+        :type output_dir: str
+
+        :return: Test List generated by the plugin
+
+        :rtype: dict
+    '''
+    suite = spec_config.name
+    pm.hook.pre_gen(spec_config=spec_config,
+                    output_dir='{0}/{1}'.format(output_dir, suite))
+    suite_test_list = pm.hook.gen(module_dir=module_dir,
+                                  output_dir=output_dir)[0]
+    pm.hook.post_gen(output_dir='{0}/{1}'.format(output_dir, suite))
+    return suite_test_list
+
+
+def _elf_cache(config):
+    '''
+        Open the ELF cache configured in the config.ini.
+
+        :param config: Config ini with the loaded by the configparser module
+
+        :type config: configparser.ConfigParser
+
+        :return: The cache, None if ``elf_cache`` is not set
+
+        :rtype: river_core.cache.ElfCache
+    '''
+    cache_dir = config['river_core'].get('elf_cache', '').strip()
+    if not cache_dir:
+        return None
+    return ElfCache(cache_dir,
+                    config['river_core'].getint('elf_cache_size',
+                                                fallback=1024))
+
+
+def _ref_cache(config):
+    '''
+        Open the reference dump cache configured in the config.ini.
+
+        :param config: Config ini with the loaded by the configparser module
+
+        :type config: configparser.ConfigParser
+
+        :return: The cache, None if ``ref_cache`` is not set
+
+        :rtype: river_core.cache.RefCache
+    '''
+    cache_dir = config['river_core'].get('ref_cache', '').strip()
+    if not cache_dir:
+        return None
+    return RefCache(cache_dir,
+                    config['river_core'].getint('ref_cache_size',
+                                                fallback=1024))
+
+
+def _ref_config(config, ref_list):
+    '''
+        Collect the configuration of the Reference plugins which decides
+        their dumps. The number of jobs is left out since it does not.
+    '''
+    ref_config = {'isa': config['river_core']['isa']}
+    for ref in ref_list:
+        ref_config[ref] = {
+            key: value
+            for key, value in config[ref].items()
+            if key not in ('jobs', 'isa')
+        }
+    return ref_config
+
+
+def _timeout_policy(config, history):
+    '''
+        Create the timeout policy configured in the config.ini.
+
+        :param config: Config ini with the loaded by the configparser module
+
+        :param history: Durations of the tests, None if they are not
+            recorded
+
+        :type config: configparser.ConfigParser
+
+        :type history: river_core.history.TestHistory
+
+        :return: The policy, None if ``timeout_factor`` is not set
+
+        :rtype: river_core.history.TimeoutPolicy
+    '''
+    river_config = config['river_core']
+    if not river_config.getfloat('timeout_factor', fallback=0):
+        return None
+    return TimeoutPolicy(history,
+                         factor=river_config.getfloat('timeout_factor'),
+                         floor=river_config.getint('timeout_floor',
+                                                   fallback=30),
+                         cap=river_config.getint('timeout_cap', fallback=3600),
+                         default=river_config.getint('timeout_default',
+                                                     fallback=None))
+
+
+def _select_tests(test_dict, only):
+    '''
+        Select the tests matching any of the selectors. ``failed`` and
+        ``timeout`` select the tests with a Failed and Timeout result,
+        ``unavailable`` the tests which do not have a result yet, and any
+        other selector is matched against the names of the tests as a glob.
+
+        :param test_dict: The test list
+
+        :param only: The selectors
+
+        :type test_dict: dict
+
+        :type only: list
+
+        :return: Names of the selected tests, in the order of the test list
+
+        :rtype: list
+    '''
+    patterns = []
+    results = set()
+    for selector in only:
+        if selector.lower() in ('failed', 'timeout'):
+            results.add(selector.capitalize())
+        elif selector.lower() == 'unavailable':
+            results.add(None)
+        else:
+            patterns.append(selector)
+    selected = []
+    for test, attr in test_dict.items():
+        result = attr.get('result')
+        if result not in final_results:
+            result = None
+        if result in results or any(
+                fnmatch.fnmatchcase(test, pattern) for pattern in patterns):
+            selected.append(test)
+    for pattern in patterns:
+        if not any(fnmatch.fnmatchcase(test, pattern) for test in test_dict):
+            logger.warning('No tests match {0}'.format(pattern))
+    return selected
+
+
+def _derived_test_list(output_dir, test_list, test_dict, name):
+    '''
+        Write a subset of a test list, to be passed on to the plugins, under
+        ``<work_dir>/.results``. The subset is stored in the same format as
+        the test list it was taken from.
+
+        :param output_dir: The work_dir of river_core
+
+        :param test_list: Path to the original test list
+
+        :param test_dict: The subset of the tests
+
+        :param name: Name of the derived test list without the extension
+
+        :type output_dir: str
+
+        :type test_list: str
+
+        :type test_dict: dict
+
+        :type name: str
+
+        :return: Path to the derived test list
+
+        :rtype: str
+    '''
+    results_dir = os.path.join(output_dir, '.results')
+    os.makedirs(results_dir, exist_ok=True)
+    path = os.path.join(results_dir, name + os.path.splitext(test_list)[1])
+    if is_db(path) and os.path.exists(path):
+        os.remove(path)
+    save_test_list(test_dict, path)
+    logger.debug('Wrote {0} tests to {1}'.format(len(test_dict), path))
+    return path
+
+
+def _sync_ref_cache(ref_cache, ref_keys, cached, work_dirs, ref_json,
+                    output_dir):
+    '''
+        Write the cached reference dumps to the work_dir of their tests and
+        store the dumps newly generated by the Reference plugins in the
+        cache. The tests served from the cache are added to the report of
+        the Reference plugins as passed.
+
+        :param ref_cache: The reference dump cache
+
+        :param ref_keys: Cache key of every test which has an ELF
+
+        :param cached: Tests whose dumps were found in the cache
+
+        :param work_dirs: The work_dir of every test
+
+        :param ref_json: Value returned by the run hook of the Reference
+            plugin
+
+        :param output_dir: The work_dir of river_core
+
+        :type ref_cache: river_core.cache.RefCache
+
+        :type ref_keys: dict
+
+        :type cached: list
+
+        :type work_dirs: dict
+
+        :type ref_json: list
+
+        :type output_dir: str
+
+        :return: The combined report, in the format of ``ref_json``
+
+        :rtype: list
+    '''
+    ref_json_data = load_pytest_json(ref_json[0] +
+                                     '.json') if ref_json else []
+    outcomes = report_outcomes(ref_json_data)
+    cached = set(cached)
+    for test, key in ref_keys.items():
+        if test in cached:
+            ref_cache.materialise(key,
+                                  os.path.join(work_dirs[test], 'ref.dump'))
+            continue
+        dump = os.path.join(work_dirs[test],
+                            outcomes.get(test, {}).get('dump') or 'ref.dump')
+        if key is not None and os.path.isfile(dump) and \
+                outcomes.get(test, {}).get('outcome') == 'passed':
+            ref_cache.store(key, dump)
+    ref_cache.evict()
+    ref_cache.save_stats()
+    ref_cache.log_stats()
+
+    report_file = '{0}/.json/ref_cache_{1}'.format(
+        output_dir,
+        datetime.datetime.now().strftime("%Y%m%d-%H%M"))
+    with open(report_file + '.json', 'w') as report:
+        for entry in ref_json_data:
+            report.write(json.dumps(entry) + '\n')
+        for test in sorted(cached):
+            report.write(
+                json.dumps({
+                    '$report_type': 'TestReport',
+                    'nodeid': test,
+                    'when': 'call',
+                    'outcome': 'passed',
+                    'longrepr': None,
+                    'sections': [['Cached', ref_cache.path(ref_keys[test])],
+                                 [
+                                     'Captured stdout call',
+                                     'Reference dump reused from the cache'
+                                 ]],
+                    'duration': 0
+                }) + '\n')
+    return [report_file]
+
+
+def _compare_dumps(compare_dict, run_outcomes, ref_outcomes, jobs, update):
+    '''
+        Compare the DuT and Reference dumps of the tests and record their
+        results. A test which timed out in either plugin gets the Timeout
+        result, since its dumps are incomplete.
+
+        :param compare_dict: The tests to compare
+
+        :param run_outcomes: Outcomes of the tests in the DuT report, as
+            returned by :py:func:`river_core.results.report_outcomes`
+
+        :param ref_outcomes: Outcomes of the tests in the Reference report
+
+        :param jobs: Number of processes to compare with
+
+        :param update: Function called with the name of every test and the
+            ``result``, ``mismatch``, ``run``, ``duration`` and ``rusage``
+            fields to record
+
+        :type compare_dict: dict
+
+        :type run_outcomes: dict
+
+        :type ref_outcomes: dict
+
+        :type jobs: int
+
+        :type update: callable
+    '''
+    # Dumps reported by the plugins, such as by simulator workers
+    dumps = {
+        test: (run_outcomes.get(test, {}).get('dump'),
+               ref_outcomes.get(test, {}).get('dump'))
+        for test in compare_dict
+    }
+    for test, result, mismatch, missing in compare_tests(
+            compare_dict, jobs, dumps=dumps):
+        run = run_outcomes.get(test, {})
+        ref = ref_outcomes.get(test, {})
+        # The dumps of a test which was killed are incomplete
+        if run.get('timeout') or ref.get('timeout'):
+            result = 'Timeout'
+            mismatch = None
+        elif missing:
+            logger.error('{0} dump for Test: {1} is missing'.format(
+                missing, test))
+            continue
+        update(test,
+               result=result,
+               mismatch=mismatch,
+               run=run.get('outcome'),
+               duration=run.get('duration'),
+               rusage={
+                   kind: outcome['rusage']
+                   for kind, outcome in (('dut', run), ('ref', ref))
+                   if outcome.get('rusage')
+               } or None)
+        if result == 'Timeout':
+            logger.error("Test {0} timed out. TEST TIMED OUT".format(test))
+        elif result != 'Passed':
+            logger.error(
+                "Dumps for test {0}. Do not match. TEST FAILED".format(test))
+            log_mismatch(test, mismatch)
+        else:
+            logger.info("Dumps for test {0} Match. TEST PASSED".format(test))
+
+
+def _run_pipeline(workers, stages, run_list, output_dir, config, batch_size,
+                  journal, suffix=''):
+    '''
+        Run the tests in batches through the shared ELF build, the DuT and
+        Reference plugins and the comparison of the dumps. Each of the three
+        stages works on a different batch at the same time, see
+        :py:func:`river_core.pipeline.run_pipeline`, so the first results are
+        in while later batches are still being built and run.
+
+        :param workers: Worker of the DuT and of the Reference plugin, keyed
+            by ``dut`` and ``ref``
+
+        :param stages: Name, last stage, init arguments and module dir of the
+            plugins, keyed by ``dut`` and ``ref``
+
+        :param run_list: Test List with the tests to run
+
+        :param output_dir: The work_dir of river_core
+
+        :param config: Config ini with the loaded by the configparser module
+
+        :param batch_size: Number of tests in a batch
+
+        :param journal: Journal to record the results of the comparison in,
+            None to not compare the dumps
+
+        :param suffix: Suffix of the files written for the batches
+
+        :type workers: dict
+
+        :type stages: dict
+
+        :type run_list: str
+
+        :type output_dir: str
+
+        :type config: configparser.ConfigParser
+
+        :type batch_size: int
+
+        :type journal: river_core.results.ResultJournal
+
+        :type suffix: str
+
+        :return: The reports of the DuT and Reference plugins over all the
+            batches, as returned by their run hooks, and the set of the
+            tests which were compared
+
+        :rtype: tuple
+    '''
+    test_dict = load_test_list(run_list)
+    batches = split_batches(list(test_dict), batch_size)
+    logger.info('Running {0} tests in {1} batches of {2}'.format(
+        len(test_dict), len(batches), batch_size))
+    shared_elf = utils.str_2_bool(config['river_core'].get(
+        'shared_elf', 'False'))
+    elf_cache = _elf_cache(config) if shared_elf else None
+    reports = {kind: None for kind in workers}
+    compared = set()
+
+    def build(batch):
+        index, tests = batch
+        batch_dict = {test: test_dict[test] for test in tests}
+        if shared_elf:
+            build_elfs(batch_dict,
+                       output_dir + '/.json',
+                       jobs=config['river_core'].getint('build_jobs',
+                                                        fallback=1),
+                       cache=elf_cache)
+        batch_list = _derived_test_list(
+            output_dir, run_list, batch_dict,
+            'pipeline_batch{0}'.format(index) + suffix)
+        return index, batch_dict, batch_list
+
+    def run(batch):
+        index, batch_dict, batch_list = batch
+        logger.info('Running batch {0} of {1}'.format(index + 1,
+                                                     len(batches)))
+        for kind, worker in workers.items():
+            name, stage, init_kwargs, module_dir = stages[kind]
+            worker.submit(_run_batch_stages, stage, init_kwargs, module_dir,
+                          batch_list)
+        data = {}
+        for kind, worker in workers.items():
+            json_file = worker.result()
+            # Plugins name their reports by the minute, so read them before
+            # the next batch overwrites them
+            data[kind] = load_pytest_json(json_file[0] +
+                                          '.json') if json_file else []
+            if json_file:
+                reports[kind] = (reports[kind] or []) + data[kind]
+        return index, batch_dict, data
+
+    def compare(batch):
+        index, batch_dict, data = batch
+        _compare_dumps(batch_dict, report_outcomes(data['dut']),
+                       report_outcomes(data['ref']),
+                       config['river_core'].getint('compare_jobs', fallback=1),
+                       journal.append)
+        compared.update(batch_dict)
+        logger.info('Compared batch {0} of {1}'.format(index + 1,
+                                                      len(batches)))
+        return index
+
+    # Set the plugins up once for all the batches where they allow it
+    for kind, worker in workers.items():
+        name, stage, init_kwargs, module_dir = stages[kind]
+        worker.submit(_init_plugin, init_kwargs)
+    for kind, worker in workers.items():
+        if not worker.result():
+            logger.warning('{0} does not implement load_tests, its init stage '
+                           'runs for every batch'.format(stages[kind][0]))
+    run_pipeline(enumerate(batches),
+                 [build, run, compare] if journal is not None else [build, run])
+    if elf_cache is not None:
+        elf_cache.log_stats()
+    # Write the reports of all the batches out as one for each plugin
+    json_files = {}
+    stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M")
+    for kind, data in reports.items():
+        if data is None:
+            json_files[kind] = None
+            continue
+        path = os.path.join(output_dir, '.json', '{0}_pipeline{1}_{2}'.format(
+            stages[kind][0], suffix, stamp))
+        with open(path + '.json', 'w') as report:
+            for entry in data:
+                report.write(json.dumps(entry) + '\n')
+        json_files[kind] = [path]
+    return json_files['dut'], json_files['ref'], compared
+
+
+def _split_jobs(budget, requested):
+    '''
+        Split a budget of jobs between plugins in proportion to the jobs each
+        of them asks for. Every plugin gets at least one job.
+
+        :param budget: Total number of jobs to split
+
+        :param requested: Jobs configured for each plugin
+
+        :type budget: int
+
+        :type requested: dict
+
+        :return: Jobs assigned to each plugin
+
+        :rtype: dict
+    '''
+    total = sum(max(1, jobs) for jobs in requested.values())
+    shares = {
+        name: budget * max(1, jobs) / total
+        for name, jobs in requested.items()
+    }
+    assigned = {name: max(1, int(share)) for name, share in shares.items()}
+    # Hand out what is left to the plugins with the largest remainders
+    spare = budget - sum(assigned.values())
+    for name in sorted(shares, key=lambda x: int(shares[x]) - shares[x]):
+        if spare <= 0:
+            break
+        assigned[name] += 1
+        spare -= 1
+    return assigned
+
+
+def _call_hook(pm, hook, **kwargs):
+    return getattr(pm.hook, hook)(**kwargs)
+
+
+def _set_coordinator(pm, name, address):
+    '''
+        Set the address on which the testRunners of a plugin worker
+        distribute their tests, see
+        :py:func:`river_core.distributed.plugin_address`.
+
+        :param pm: Plugin manager of the worker
+
+        :param name: Name of the plugin
+
+        :param address: Address (``host:port``) of the coordinator
+
+        :type pm: pluggy.PluginManager
+
+        :type name: str
+
+        :type address: str
+    '''
+    utils.testRunner.coordinator = address
+    logger.info('{0} Coordinator : {1}'.format(name, address))
+
+
+class PluginWorker():
+    """
+    Runs the hooks of a plugin in a forked process, so that independent
+    plugins can work concurrently. The process keeps the state of the plugin
+    between calls and lives until :py:meth:`stop` is called. It is not a
+    daemon, so that the plugin can start processes of its own, and has to be
+    stopped explicitly.
+    """
+
+    #: Seconds a worker still busy with a call gets to finish when stopped
+    stop_timeout = 10
+
+    def __init__(self, name, pm):
+        """Constructor.
+
+        :param name: Name of the plugin, used in the logs
+
+        :param pm: Plugin manager with the plugin registered
+
+        :type name: str
+
+        :type pm: pluggy.PluginManager
+        """
+        self.name = name
+        self.pm = pm
+        context = multiprocessing.get_context('fork')
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=self._serve,
+                                       args=(child_conn,),
+                                       name=name,
+                                       daemon=False)
+        self.process.start()
+
+    def _serve(self, conn):
+        while True:
+            request = conn.recv()
+            if request is None:
+                break
+            function, args, kwargs = request
+            try:
+                conn.send((True, function(self.pm, *args, **kwargs)))
+            except BaseException:
+                conn.send((False, traceback.format_exc()))
+
+    def submit(self, function, *args, **kwargs):
+        """
+        Call ``function(pm, *args, **kwargs)`` in the worker process without
+        waiting for it to finish.
+        """
+        self.conn.send((function, args, kwargs))
+
+    def result(self):
+        """
+        Wait for the last submitted call to finish and return its value.
+        Exits river_core if the call failed.
+        """
+        try:
+            success, value = self.conn.recv()
+        except EOFError:
+            success, value = False, 'worker process died'
+        if not success:
+            logger.error('{0} plugin failed:\n{1}'.format(self.name, value))
+            raise SystemExit
+        return value
+
+    def call(self, function, *args, **kwargs):
+        """
+        Call ``function(pm, *args, **kwargs)`` in the worker process and
+        return its value.
+        """
+        self.submit(function, *args, **kwargs)
+        return self.result()
+
+    def stop(self):
+        """
+        Shut down the worker process. A worker which is still busy with a
+        call, as when river_core exits on the failure of another plugin, is
+        terminated after ``stop_timeout`` seconds.
+        """
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(self.stop_timeout)
+        if self.process.is_alive():
+            logger.warning('Terminating the {0} plugin worker'.format(
+                self.name))
+            self.process.terminate()
+            self.process.join()
+        self.conn.close()
+
+
 def confirm():
     """
     Ask user to enter Y or N (case-insensitive).
@@ -266,7 +1180,7 @@ def rivercore_clean(config_file, verbosity):
             logger.info(output_dir + ' directory deleted')
 
 
-def rivercore_generate(config_file, verbosity):
+def rivercore_generate(config_file, verbosity, concurrent=False):
     '''
         Function to generate the assembly programs using the plugin as configured in the config.ini.
 
@@ -274,9 +1188,14 @@ def rivercore_generate(config_file, verbosity):
 
         :param verbosity: Verbosity level for the framework
 
+        :param concurrent: Run the generators concurrently, each in a
+            process of its own
+
         :type config_file: click.Path
 
         :type verbosity: str
+
+        :type concurrent: bool
     '''
 
     logger.level(verbosity)
@@ -288,9 +1207,6 @@ def rivercore_generate(config_file, verbosity):
 
     logger.info('****** Generation Mode ****** ')
 
-    # TODO Test multiple plugin cases
-    # Current implementation is using for loop, which might be a bad idea for parallel processing.
-
     suite_list = config['river_core']['generator'].replace(' ', '').split(',')
 
     logger.info(
@@ -300,6 +1216,16 @@ def rivercore_generate(config_file, verbosity):
     logger.info("ISA : {0}".format(config['river_core']['isa']))
     test_list = {}
 
+    concurrent = concurrent and len(suite_list) > 1
+    # Split the global job budget between the concurrent generators
+    if config['river_core'].get('gen_jobs') and concurrent:
+        gen_jobs = _split_jobs(
+            config['river_core'].getint('gen_jobs'),
+            {suite: config[suite].getint('jobs') for suite in suite_list})
+        for suite in suite_list:
+            config[suite]['jobs'] = str(gen_jobs[suite])
+
+    generators = []
     for suite in suite_list:
 
         # Give Plugin Info
@@ -334,39 +1260,78 @@ def rivercore_generate(config_file, verbosity):
             logger.error(suite + " not found at : " + path_to_module + ".\n" +
                          str(txt))
             raise SystemExit
+        generators.append((suite, generatorpm))
 
-        generatorpm.hook.pre_gen(spec_config=config[suite],
-                                 output_dir='{0}/{1}'.format(output_dir, suite))
-        test_list.update(
-            generatorpm.hook.gen(module_dir=path_to_module,
-                                 output_dir=output_dir)[0])
-        if not isinstance(test_list, dict):
+    # Run the generators concurrently, each in a worker of its own
+    if concurrent:
+        workers = []
+        try:
+            for suite, generatorpm in generators:
+                worker = PluginWorker(suite, generatorpm)
+                worker.submit(_run_generator_stages, config[suite],
+                              path_to_module, output_dir)
+                workers.append((suite, worker))
+            suite_tests = [(suite, worker.result())
+                           for suite, worker in workers]
+        finally:
+            for suite, worker in workers:
+                worker.stop()
+    else:
+        suite_tests = [(suite,
+                        _run_generator_stages(generatorpm, config[suite],
+                                              path_to_module, output_dir))
+                       for suite, generatorpm in generators]
+
+    test_origin = {}
+    collisions = []
+    for suite, suite_test_list in suite_tests:
+        if not isinstance(suite_test_list, dict):
             logger.error(
                 'Test List returned by the gen hook of Generator is of type: ' +
-                str(type(test_list)) + '. Expected Dict')
+                str(type(suite_test_list)) + '. Expected Dict')
             raise SystemExit
-
-        generatorpm.hook.post_gen(
-            output_dir='{0}/{1}'.format(output_dir, suite))
+        for test in suite_test_list:
+            if test in test_origin:
+                collisions.append((test, test_origin[test], suite))
+            else:
+                test_origin[test] = suite
+        test_list.update(suite_test_list)
+    if collisions:
+        logger.error('{0} test names are generated by more than one generator:'.
+                     format(len(collisions)))
+        for test, first, second in collisions:
+            logger.error('{0} : {1}, {2}'.format(test, first, second))
+        raise SystemExit
 
     test_list_file = output_dir + '/test_list.yaml'
     logger.info('Dumping generated Test-List at: ' + str(test_list_file))
     testfile = open(test_list_file, 'w')
     utils.yaml.dump(test_list, testfile)
     testfile.close()
+    if config['river_core'].get('test_list_format', 'yaml') == 'sqlite':
+        test_db_file = output_dir + '/test_list.db'
+        logger.info('Dumping generated Test-List at: ' + str(test_db_file))
+        if os.path.exists(test_db_file):
+            os.remove(test_db_file)
+        with TestListDB(test_db_file) as test_db:
+            test_db.update(test_list)
+    # Results journalled against an earlier test list do not apply any more,
+    # neither do those of the shards of an earlier regression
+    ResultJournal(output_dir).clear()
+    for journal_file in glob.glob(
+            os.path.join(output_dir, '.results', 'journal_shard*.jsonl')):
+        os.remove(journal_file)
 
     logger.info('Validating Generated Test-List')
-    testschema = yaml.load(testlist_schema)
-    validator = YamlValidator(testschema)
-    validator.allow_unknown = False
-    for test, fields in test_list.items():
-        valid = validator.validate(fields)
-        if not valid:
-            logger.error('Test List Validation failed:')
-            error_list = validator.errors
+    validate_jobs = config['river_core'].getint('validate_jobs', fallback=1)
+    test_errors = validate_test_list(test_list, jobs=validate_jobs)
+    if test_errors:
+        logger.error('Test List Validation failed for {0} of {1} tests:'.format(
+            len(test_errors), len(test_list)))
+        for test, error_list in test_errors.items():
             for x in error_list:
                 logger.error('{0} [ {1} ] : {2}'.format(test, x, error_list[x]))
-            raise SystemExit
+        raise SystemExit
     logger.info('Test List Validated successfully')
 
     # Open generation report in browser
@@ -382,8 +1347,18 @@ def rivercore_generate(config_file, verbosity):
                 return 1
 
 
-def rivercore_compile(config_file, test_list, coverage, verbosity, dut_flags,
-                      ref_flags, compare):
+def rivercore_compile(config_file,
+                      test_list,
+                      coverage,
+                      verbosity,
+                      dut_flags,
+                      ref_flags,
+                      compare,
+                      concurrent=False,
+                      resume=False,
+                      only=(),
+                      shard=None,
+                      pipeline=None):
     '''
 
         Function to compile generated assembly programs using the plugin as configured in the config.ini.
@@ -402,6 +1377,17 @@ def rivercore_compile(config_file, test_list, coverage, verbosity, dut_flags,
 
         :param compare: Verbosity level for the framework
 
+        :param concurrent: Run the DuT and Reference plugins concurrently
+
+        :param resume: Only run the tests without a Passed/Failed result
+
+        :param only: Selectors of the tests to run, see :py:func:`_select_tests`
+
+        :param shard: Run only one shard of the tests, as (index, count)
+
+        :param pipeline: Run the tests through the build, run and compare
+            stages in batches of this many tests, see :py:func:`_run_pipeline`
+
         :type config_file: click.Path
 
         :type test_list: click.Path
@@ -415,6 +1401,16 @@ def rivercore_compile(config_file, test_list, coverage, verbosity, dut_flags,
         :type ref_flags: click.Choice 
 
         :type compare: bool 
+
+        :type concurrent: bool
+
+        :type resume: bool
+
+        :type only: tuple
+
+        :type shard: tuple
+
+        :type pipeline: int
     '''
     logger.level(verbosity)
     config = configparser.ConfigParser()
@@ -436,6 +1432,16 @@ def rivercore_compile(config_file, test_list, coverage, verbosity, dut_flags,
     logger.info("Generator Plugin : {0}".format(asm_gen))
     logger.info("Target Plugin : {0}".format(target_list))
     logger.info("Reference Plugin : {0}".format(ref_list))
+    # Hand the tests run through a testRunner out to the connected workers
+    utils.testRunner.coordinator = config['river_core'].get('coordinator')
+    if utils.testRunner.coordinator:
+        logger.info("Coordinator : {0}".format(utils.testRunner.coordinator))
+    Coordinator.worker_timeout = config['river_core'].getint(
+        'worker_timeout', fallback=Coordinator.worker_timeout)
+    # Stream the output of the tests run through a testRunner to log files
+    test_logs = config['river_core'].get('test_logs', '').strip()
+    utils.testRunner.log_dir = os.path.join(output_dir, test_logs) \
+        if test_logs else None
 
     # Set default values:
     target_json = None
@@ -446,6 +1452,124 @@ def rivercore_compile(config_file, test_list, coverage, verbosity, dut_flags,
         coverage_config = config['coverage']
     else:
         coverage_config = None
+    # Tests handed to the plugins, all of them unless a subset is selected,
+    # longest first if their durations are known
+    run_list = test_list
+    run_tests = None
+    history = None
+    # The shards of a regression keep their files apart, and write their
+    # results to their own test list and journal to be gathered later
+    suffix = '_shard{0}of{1}'.format(*shard) if shard else ''
+    result_list = test_list
+    if utils.str_2_bool(config['river_core'].get('history', 'True')):
+        history = TestHistory(output_dir)
+    timeout_policy = _timeout_policy(config, history)
+    if resume or only or history is not None or shard or \
+            timeout_policy is not None:
+        test_dict = load_test_list(test_list)
+        journal = ResultJournal(output_dir, 'journal' + suffix)
+        if journal.compact(test_dict) and not shard:
+            save_test_list(test_dict, test_list)
+        if not shard:
+            journal.clear()
+        run_tests = _select_tests(test_dict, only) if only else list(test_dict)
+        if resume:
+            run_tests = [
+                test for test in run_tests
+                if test_dict[test].get('result') not in resumed_results
+            ]
+        if shard:
+            run_tests = shard_tests(run_tests, shard[0], shard[1], history)
+            logger.info('Shard {0} of {1} has {2} tests'.format(
+                shard[0], shard[1], len(run_tests)))
+        run_dict = {test: test_dict[test] for test in run_tests}
+        if history is not None:
+            run_tests = history.order(run_tests)
+            run_dict = {test: run_dict[test] for test in run_tests}
+            logger.info('Ordered the tests by their duration in {0}'.format(
+                history.path))
+        if timeout_policy is not None:
+            run_dict = {
+                test: dict(attr, timeout=timeout_policy.timeout(test))
+                for test, attr in run_dict.items()
+            }
+        logger.info('Running {0} of {1} tests'.format(len(run_tests),
+                                                      len(test_dict)))
+        if not run_tests:
+            logger.info('No tests are selected, not running the plugins')
+            dut_flags = ref_flags = None
+        if shard or (run_tests and (run_dict != test_dict or
+                                    run_tests != list(test_dict))):
+            run_list = _derived_test_list(output_dir, test_list, run_dict,
+                                          'run_test_list' + suffix)
+        if shard:
+            result_list = run_list
+    if pipeline and (len(target_list) != 1 or len(ref_list) != 1 or
+                     '' in target_list or '' in ref_list or
+                     dut_flags != 'run' or ref_flags != 'run'):
+        logger.warning('Pipeline mode needs one DuT and one Reference plugin '
+                       'running up to the run stage')
+        pipeline = None
+    if pipeline and config['river_core'].get('ref_cache'):
+        logger.warning('The reference cache is not used in pipeline mode')
+    # Build the ELFs once for both the DuT and the Reference plugins, batch
+    # by batch in pipeline mode
+    if not pipeline and utils.str_2_bool(
+            config['river_core'].get('shared_elf', 'False')) and \
+            (dut_flags in ['build', 'run'] or ref_flags in ['build', 'run']):
+        test_dict = load_test_list(run_list)
+        elf_cache = _elf_cache(config)
+        built = build_elfs(test_dict,
+                           output_dir + '/.json',
+                           jobs=config['river_core'].getint('build_jobs',
+                                                            fallback=1),
+                           cache=elf_cache)
+        logger.info('Built {0} of {1} ELFs'.format(len(built),
+                                                  len(test_dict)))
+        if elf_cache is not None:
+            elf_cache.log_stats()
+        # Keep the ELFs out of the test list of the user, or the plugins
+        # would go on linking them after shared_elf is turned off
+        if run_list == test_list:
+            run_list = _derived_test_list(output_dir, test_list, test_dict,
+                                          'run_test_list' + suffix)
+        else:
+            save_test_list(test_dict, run_list)
+    # Reuse the reference dumps of the ELFs which were run before
+    ref_cache = None if pipeline else _ref_cache(config)
+    ref_keys = {}
+    cached_refs = []
+    ref_test_list = run_list
+    # The Reference plugins are not run at all if every dump is cached
+    refs_cached = False
+    if ref_cache is not None and ref_flags == 'run' and '' not in ref_list:
+        test_dict = load_test_list(run_list)
+        ref_config = _ref_config(config, ref_list)
+        for test, attr in test_dict.items():
+            if not attr.get('elf'):
+                continue
+            ref_keys[test] = ref_cache.key(attr['elf'], ref_config)
+            if ref_keys[test] is not None and ref_cache.lookup(ref_keys[test]):
+                cached_refs.append(test)
+        work_dirs = {test: attr['work_dir'] for test, attr in test_dict.items()}
+        logger.info('Found the reference dumps of {0} of {1} tests in {2}'.
+                    format(len(cached_refs), len(test_dict),
+                           ref_cache.cache_dir))
+        refs_cached = len(cached_refs) == len(test_dict)
+        if cached_refs and not refs_cached:
+            ref_test_list = _derived_test_list(
+                output_dir, run_list, {
+                    test: attr
+                    for test, attr in test_dict.items()
+                    if test not in set(cached_refs)
+                }, 'ref_test_list' + suffix)
+    # Plugins waiting to be run concurrently
+    pending_stages = []
+    if concurrent and ('' in target_list or '' in ref_list or
+                       not dut_flags or not ref_flags):
+        logger.warning(
+            'Concurrent mode needs both the DuT and Reference plugins')
+        concurrent = False
     if '' in target_list:
         logger.info('No targets configured, so moving on the reference')
     else:
@@ -489,30 +1613,20 @@ def rivercore_compile(config_file, test_list, coverage, verbosity, dut_flags,
                         'Hello, it seems you are debugging, this usually indicates that the loading failed.\nCheck whether Python file being loaded is fine i.e. no errors and warnings. etc'
                     )
                     raise SystemExit
-            if dut_flags == 'init':
-                logger.debug('Single mode flag detected\nRunning init')
-                dutpm.hook.init(ini_config=config[target],
-                                test_list=test_list,
-                                work_dir=output_dir,
-                                coverage_config=coverage_config,
-                                plugin_path=path_to_module)
-            elif dut_flags == 'build':
-                logger.debug('Single mode flag detected\nRunning build')
-                dutpm.hook.init(ini_config=config[target],
-                                test_list=test_list,
-                                work_dir=output_dir,
-                                coverage_config=coverage_config,
-                                plugin_path=path_to_module)
-                dutpm.hook.build()
-            elif dut_flags == 'run':
-                logger.debug('All modes enabled\nRunning run')
-                dutpm.hook.init(ini_config=config[target],
-                                test_list=test_list,
-                                work_dir=output_dir,
-                                coverage_config=coverage_config,
-                                plugin_path=path_to_module)
-                dutpm.hook.build()
-                target_json = dutpm.hook.run(module_dir=path_to_module)
+            if dut_flags in ['init', 'build', 'run']:
+                logger.debug('Running {0} on the DuT plugin'.format(dut_flags))
+                init_kwargs = dict(ini_config=config[target],
+                                   test_list=run_list,
+                                   work_dir=output_dir,
+                                   coverage_config=coverage_config,
+                                   plugin_path=path_to_module)
+                if concurrent or pipeline:
+                    pending_stages.append(('dut', target, dutpm, dut_flags,
+                                           init_kwargs, path_to_module))
+                else:
+                    target_json = _run_plugin_stages(dutpm, dut_flags,
+                                                     init_kwargs,
+                                                     path_to_module)
             else:
                 logger.warning('DuT plugin disabled')
 
@@ -558,134 +1672,209 @@ def rivercore_compile(config_file, test_list, coverage, verbosity, dut_flags,
                     )
                     raise SystemExit
 
-            if ref_flags == 'init':
-                logger.debug('Single mode flag detected\nRunning init')
-                refpm.hook.init(ini_config=config[ref],
-                                test_list=test_list,
-                                work_dir=output_dir,
-                                coverage_config=coverage_config,
-                                plugin_path=path_to_module)
-            elif ref_flags == 'build':
-                logger.debug('Single mode flag detected\nRunning build')
-                refpm.hook.init(ini_config=config[ref],
-                                test_list=test_list,
-                                work_dir=output_dir,
-                                coverage_config=coverage_config,
-                                plugin_path=path_to_module)
-                refpm.hook.build()
-            elif ref_flags == 'run':
-                logger.debug('All modes detected\nRunning build')
-                refpm.hook.init(ini_config=config[ref],
-                                test_list=test_list,
-                                work_dir=output_dir,
-                                coverage_config=coverage_config,
-                                plugin_path=path_to_module)
-                refpm.hook.build()
-                ref_json = refpm.hook.run(module_dir=path_to_module)
+            if refs_cached:
+                logger.info('All the reference dumps are cached, not running '
+                            'the {0} plugin'.format(ref))
+            elif ref_flags in ['init', 'build', 'run']:
+                logger.debug('Running {0} on the Ref plugin'.format(ref_flags))
+                init_kwargs = dict(ini_config=config[ref],
+                                   test_list=ref_test_list,
+                                   work_dir=output_dir,
+                                   coverage_config=coverage_config,
+                                   plugin_path=path_to_module)
+                if concurrent or pipeline:
+                    pending_stages.append(('ref', ref, refpm, ref_flags,
+                                           init_kwargs, path_to_module))
+                else:
+                    ref_json = _run_plugin_stages(refpm, ref_flags,
+                                                  init_kwargs, path_to_module)
             else:
                 logger.warning('Ref Plugin disabled')
 
-        ## Comparing Dumps
-        if compare:
-            result = 'Unavailable'
-            test_dict = utils.load_yaml(test_list)
-            gen_json_data = []
-            target_json_data = []
-            ref_json_data = []
-            for test, attr in test_dict.items():
-                test_wd = attr['work_dir']
-                if not os.path.isfile(test_wd + '/dut.dump'):
-                    logger.error(
-                        'Dut dump for Test: {0} is missing'.format(test))
-                    continue
-                if not os.path.isfile(test_wd + '/ref.dump'):
-                    logger.error(
-                        'Ref dump for Test: {0} is missing'.format(test))
-                    continue
-                filecmp.clear_cache()
-                result = filecmp.cmp(test_wd + '/dut.dump',
-                                     test_wd + '/ref.dump')
-                test_dict[test]['result'] = 'Passed' if result else 'Failed'
-                utils.save_yaml(test_dict, test_list)
-                if not result:
-                    logger.error(
-                        "Dumps for test {0}. Do not match. TEST FAILED".format(
-                            test))
+        # Each plugin runs all its stages in a worker of its own, the
+        # comparison starts once all of them are done
+        dut_worker = ref_worker = None
+        workers = []
+        try:
+            if pending_stages:
+                logger.info('Running {0} concurrently'.format(', '.join(
+                    name for kind, name, *rest in pending_stages)))
+            for kind, name, pm, stage, init_kwargs, module_dir in \
+                    pending_stages:
+                logger.info('{0} Jobs : {1}'.format(
+                    name, init_kwargs['ini_config']['jobs']))
+                worker = PluginWorker(name, pm)
+                if utils.testRunner.coordinator:
+                    worker.call(
+                        _set_coordinator, name,
+                        plugin_address(utils.testRunner.coordinator, kind))
+                if not pipeline:
+                    worker.submit(_run_plugin_stages, stage, init_kwargs,
+                                  module_dir)
+                workers.append((kind, worker))
+            compared = set()
+            if pipeline:
+                target_json, ref_json, compared = _run_pipeline(
+                    dict(workers), {
+                        kind: (name, stage, init_kwargs, module_dir)
+                        for kind, name, pm, stage, init_kwargs, module_dir in
+                        pending_stages
+                    },
+                    run_list,
+                    output_dir,
+                    config,
+                    pipeline,
+                    ResultJournal(output_dir, 'journal' +
+                                  suffix) if compare else None,
+                    suffix=suffix)
+            for kind, worker in workers:
+                if kind == 'dut':
+                    if not pipeline:
+                        target_json = worker.result()
+                    dut_worker = worker
+                else:
+                    if not pipeline:
+                        ref_json = worker.result()
+                    ref_worker = worker
+            if history is not None:
+                if target_json:
+                    history.record(
+                        'dut',
+                        report_outcomes(load_pytest_json(target_json[0] +
+                                                         '.json')))
+                if ref_json:
+                    history.record(
+                        'ref',
+                        report_outcomes(load_pytest_json(ref_json[0] +
+                                                         '.json')))
+                history.save(
+                    os.path.join(output_dir, '.results', 'history' + suffix +
+                                 '.json') if shard else None)
+            if ref_keys:
+                ref_json = _sync_ref_cache(ref_cache, ref_keys, cached_refs,
+                                           work_dirs, ref_json, output_dir)
+
+            ## Comparing Dumps
+            if compare:
+                result = 'Unavailable'
+                test_dict = load_test_list(result_list)
+                gen_json_data = []
+                target_json_data = []
+                ref_json_data = []
+                # Start checking things after running the commands
+                # Report generation starts here
+                if target_json:
+                    target_json_data = load_pytest_json(target_json[0] +
+                                                        '.json')
+                if ref_json:
+                    ref_json_data = load_pytest_json(ref_json[0] + '.json')
+                run_outcomes = report_outcomes(target_json_data)
+                ref_outcomes = report_outcomes(ref_json_data)
+
+                # Fold in the results of an earlier run which did not make it to
+                # the test list before comparing again
+                journal = ResultJournal(output_dir, 'journal' + suffix)
+                recovered = journal.compact(test_dict)
+                if recovered:
+                    logger.info('Recovered {0} results from {1}'.format(
+                        recovered, journal.path))
+                    save_test_list(test_dict, result_list)
+                # A shard keeps all its results in the journal for gather
+                if not shard:
+                    journal.clear()
+
+                compare_jobs = config['river_core'].getint('compare_jobs',
+                                                           fallback=1)
+                result_store = ResultStore(
+                    result_list, test_dict,
+                    config['river_core'].getint('flush_interval', fallback=0),
+                    journal)
+                logger.info(
+                    'Comparing dumps with {0} jobs'.format(compare_jobs))
+                # Only the tests which were run have new dumps, and those which
+                # went through the pipeline are compared already
+                if run_tests is not None:
+                    compare_dict = {test: test_dict[test] for test in run_tests}
                 else:
+                    compare_dict = test_dict
+                if compared:
+                    compare_dict = {
+                        test: attr
+                        for test, attr in compare_dict.items()
+                        if test not in compared
+                    }
+                try:
+                    _compare_dumps(compare_dict, run_outcomes, ref_outcomes,
+                                   compare_jobs, result_store.update)
+                finally:
+                    result_store.flush()
+
+                if not target_json:
+                    logger.debug('Could not find a target_json file')
+                    for test, attr in compare_dict.items():
+                        test_dict[test]['result'] = 'Unavailable'
+                        logger.debug(
+                            'Resetting values in test_dict; Triggered by the lack of DuT values'
+                        )
+                if not ref_json:
+                    logger.debug('Could not find a reference_json file')
+                    for test, attr in compare_dict.items():
+                        test_dict[test]['result'] = 'Unavailable'
+                        logger.debug(
+                            'Resetting values in test_dict; Triggered by the lack of Ref values'
+                        )
+
+                # Need to an Gen json file for final report
+                # TODO:CHECK: Only issue is that this can ideally be a wrong approach
+
+                try:
                     logger.info(
-                        "Dumps for test {0} Match. TEST PASSED".format(test))
-
-            # Start checking things after running the commands
-            # Report generation starts here
-            # Target
-            # Move this into a function
-            if target_json:
-                json_file = open(target_json[0] + '.json', 'r')
-                target_json_list = json_file.readlines()
-                json_file.close()
-                for line in target_json_list:
-                    target_json_data.append(json.loads(line))
-            else:
-                logger.debug('Could not find a target_json file')
-                for test, attr in test_dict.items():
-                    test_dict[test]['result'] = 'Unavailable'
-                    logger.debug(
-                        'Resetting values in test_dict; Triggered by the lack of DuT values'
-                    )
-            if ref_json:
-                json_file = open(ref_json[0] + '.json', 'r')
-                ref_json_list = json_file.readlines()
-                json_file.close()
-                for line in ref_json_list:
-                    ref_json_data.append(json.loads(line))
-            else:
-                logger.debug('Could not find a reference_json file')
-                for test, attr in test_dict.items():
-                    test_dict[test]['result'] = 'Unavailable'
+                        "Checking for a generator json to create final report")
+                    json_files = glob.glob(
+                        output_dir + '/.json/{0}*.json'.format(
+                            config['river_core']['generator']))
                     logger.debug(
-                        'Resetting values in test_dict; Triggered by the lack of Ref values'
-                    )
+                        "Detected generated JSON Files: {0}".format(json_files))
 
-            # Need to an Gen json file for final report
-            # TODO:CHECK: Only issue is that this can ideally be a wrong approach
+                    # Can only get one file back
+                    gen_json_file = max(json_files, key=os.path.getctime)
+                    gen_json_data = load_pytest_json(gen_json_file)
 
-            try:
-                logger.info(
-                    "Checking for a generator json to create final report")
-                json_files = glob.glob(output_dir + '/.json/{0}*.json'.format(
-                    config['river_core']['generator']))
-                logger.debug(
-                    "Detected generated JSON Files: {0}".format(json_files))
-
-                # Can only get one file back
-                gen_json_file = max(json_files, key=os.path.getctime)
-                json_file = open(gen_json_file, 'r')
-                target_json_list = json_file.readlines()
-                json_file.close()
-                for line in target_json_list:
-                    gen_json_data.append(json.loads(line))
+                except:
+                    logger.warning("Couldn't find a generator JSON file")
+                    gen_json_data = []
+                    gen_json_file = []
+
+                if (target_json and ref_json and gen_json_file):
+                    # See if space saver is enabled when we have all the data
+                    if workers:
+                        dut_worker.call(_call_hook,
+                                        'post_run',
+                                        test_dict=test_dict,
+                                        config=config)
+                        ref_worker.call(_call_hook,
+                                        'post_run',
+                                        test_dict=test_dict,
+                                        config=config)
+                    else:
+                        dutpm.hook.post_run(test_dict=test_dict, config=config)
+                        refpm.hook.post_run(test_dict=test_dict, config=config)
 
-            except:
-                logger.warning("Couldn't find a generator JSON file")
+            else:
+                logger.info(
+                    'Comparison was disabled\nHence no diff would be available')
+                result = 'Unavailable'
+                test_dict = load_test_list(result_list)
+                logger.debug('Resetting values in test_dict')
+                for test in test_dict if run_tests is None else run_tests:
+                    test_dict[test]['result'] = 'Unavailable'
                 gen_json_data = []
-                gen_json_file = []
-
-            if (target_json and ref_json and gen_json_file):
-                # See if space saver is enabled when we have all the data
-                dutpm.hook.post_run(test_dict=test_dict, config=config)
-                refpm.hook.post_run(test_dict=test_dict, config=config)
+                target_json_data = []
+                ref_json_data = []
 
-        else:
-            logger.info(
-                'Comparison was disabled\nHence no diff would be available')
-            result = 'Unavailable'
-            test_dict = utils.load_yaml(test_list)
-            logger.debug('Resetting values in test_dict')
-            for test, attr in test_dict.items():
-                test_dict[test]['result'] = 'Unavailable'
-            gen_json_data = []
-            target_json_data = []
-            ref_json_data = []
+        finally:
+            for kind, worker in workers:
+                worker.stop()
 
         logger.info("Now generating some good HTML reports for you")
         report_html = generate_report(output_dir, gen_json_data,
@@ -899,6 +2088,161 @@ def rivercore_merge(verbosity, db_folders, output, config_file):
             logger.info("Couldn't open the browser")
 
 
+def rivercore_convert(src, dest, verbosity):
+    '''
+        Function to convert a test list between the YAML and SQLite formats
+
+        :param src: Test List to convert
+
+        :param dest: Path of the converted Test List
+
+        :param verbosity: Verbosity level for the framework
+
+        :type src: click.Path
+
+        :type dest: click.Path
+
+        :type verbosity: str
+    '''
+    logger.level(verbosity)
+    logger.info('****** Convert Mode ******')
+    convert_test_list(src, dest)
+
+
+def rivercore_gather(config_file, test_list, work_dirs, verbosity):
+    '''
+        Function to gather the results of the shards of a regression into the
+        test list and create a single report.
+
+        :param config_file: Config.ini file for generation
+
+        :param test_list: Test List the shards were run from
+
+        :param work_dirs: work_dirs of the shards, the one in the config.ini
+            if empty
+
+        :param verbosity: Verbosity level for the framework
+
+        :type config_file: click.Path
+
+        :type test_list: click.Path
+
+        :type work_dirs: tuple
+
+        :type verbosity: str
+    '''
+    logger.level(verbosity)
+    config = configparser.ConfigParser()
+    config.read(config_file)
+    logger.info('****** Gather Mode ******')
+
+    output_dir = config['river_core']['work_dir']
+    test_dict = load_test_list(test_list)
+    journals = []
+    history = TestHistory(output_dir)
+    for work_dir in work_dirs or (output_dir,):
+        results_dir = os.path.join(work_dir, '.results')
+        for journal_file in sorted(
+                glob.glob(os.path.join(results_dir, 'journal*.jsonl'))):
+            logger.info('Gathering results from {0}'.format(journal_file))
+            journals.append(
+                ResultJournal(work_dir,
+                              os.path.basename(journal_file)[:-len('.jsonl')]))
+        for history_file in sorted(
+                glob.glob(os.path.join(results_dir, 'history_shard*.json'))):
+            history.merge(history_file)
+            os.remove(history_file)
+    if not journals:
+        logger.error('No result journals found in {0}'.format(', '.join(
+            work_dirs or (output_dir,))))
+        raise SystemExit
+    gathered = merge_journals(journals, test_dict)
+    logger.info('Gathered the results of {0} of {1} tests'.format(
+        gathered, len(test_dict)))
+    save_test_list(test_dict, test_list)
+    # The results of the shards are in the test list now, and must not be
+    # gathered again into the next regression
+    for journal in journals:
+        if os.path.basename(journal.path).startswith('journal_shard'):
+            journal.clear()
+    if history.recorded:
+        history.save()
+
+    try:
+        json_files = glob.glob(output_dir + '/.json/{0}*.json'.format(
+            config['river_core']['generator']))
+        gen_json_data = load_pytest_json(max(json_files,
+                                             key=os.path.getctime))
+    except ValueError:
+        logger.warning("Couldn't find a generator JSON file")
+        gen_json_data = []
+    for test, attr in test_dict.items():
+        attr.setdefault('result', 'Unavailable')
+    generate_report(output_dir, gen_json_data, [], [], config, test_dict)
+
+
+def rivercore_cache(config_file, clear, verbosity):
+    '''
+        Function to report the statistics of the caches configured in the
+        config.ini, or to clear them.
+
+        :param config_file: Config.ini file for generation
+
+        :param clear: Remove all the entries from the caches
+
+        :param verbosity: Verbosity level for the framework
+
+        :type config_file: click.Path
+
+        :type clear: bool
+
+        :type verbosity: str
+    '''
+    logger.level(verbosity)
+    config = configparser.ConfigParser()
+    config.read(config_file)
+    logger.info('****** Cache Mode ******')
+    caches = [
+        cache for cache in (_elf_cache(config), _ref_cache(config))
+        if cache is not None
+    ]
+    if not caches:
+        logger.warning('No caches are configured in {0}'.format(config_file))
+    for cache in caches:
+        if clear:
+            logger.info('Clearing {0}'.format(cache.cache_dir))
+            cache.clear()
+        else:
+            cache.log_stats()
+
+
+def rivercore_worker(address, jobs, idle_timeout, verbosity):
+    '''
+        Function to run the tests handed out by the coordinator of a compile
+        run, see :py:func:`river_core.distributed.run_worker`.
+
+        :param address: Addresses of the coordinators as host:port
+
+        :param jobs: Number of tests to run in parallel
+
+        :param idle_timeout: Seconds without a coordinator after which to
+            exit, 0 to wait forever
+
+        :param verbosity: Verbosity level for the framework
+
+        :type address: list
+
+        :type jobs: int
+
+        :type idle_timeout: int
+
+        :type verbosity: str
+    '''
+    logger.level(verbosity)
+    logger.info('****** Worker Mode ******')
+    run_worker(list(address), jobs, idle_timeout)
+
+
 def rivercore_setup(config, dut, gen, ref, verbosity):
     '''
         Function to generate sample plugins 
@@ -963,18 +2307,6 @@ def rivercore_setup(config, dut, gen, ref, verbosity):
         with open(cwd + '/' + gen + '/' + gen + '_plugin.py', 'w') as file:
             file.write(filedata)
 
-        # conftest
-        with open(cwd + '/' + gen + '/' + 'conftest.py', 'r') as file:
-            filedata = file.read()
-
-        # Replace the target string
-        logger.debug('Replacing names')
-        filedata = filedata.replace('sample', gen.lower())
-
-        # Write the file out again
-        with open(cwd + '/' + gen + '/' + 'conftest.py', 'w') as file:
-            file.write(filedata)
-
         logger.info(
             'Created {0} Plugin in the current working directory'.format(gen))
 
@@ -1004,18 +2336,6 @@ def rivercore_setup(config, dut, gen, ref, verbosity):
         with open(cwd + '/' + dut + '/' + dut + '_plugin.py', 'w') as file:
             file.write(filedata)
 
-        # conftest
-        with open(cwd + '/' + dut + '/' + 'conftest.py', 'r') as file:
-            filedata = file.read()
-
-        # Replace the target string
-        logger.debug('Replacing names')
-        filedata = filedata.replace('sample', dut.lower())
-
-        # Write the file out again
-        with open(cwd + '/' + dut + '/' + 'conftest.py', 'w') as file:
-            file.write(filedata)
-
         logger.info(
             'Created {0} Plugin in the current working directory'.format(dut))
 
@@ -1046,17 +2366,5 @@ def rivercore_setup(config, dut, gen, ref, verbosity):
         with open(cwd + '/' + ref + '/' + ref + '_plugin.py', 'w') as file:
             file.write(filedata)
 
-        # conftest
-        with open(cwd + '/' + ref + '/' + 'conftest.py', 'r') as file:
-            filedata = file.read()
-
-        # Replace the target string
-        logger.debug('Replacing names')
-        filedata = filedata.replace('sample', ref.lower())
-
-        # Write the file out again
-        with open(cwd + '/' + ref + '/' + 'conftest.py', 'w') as file:
-            file.write(filedata)
-
         logger.info(
             'Created {0} Plugin in the current working directory'.format(ref))
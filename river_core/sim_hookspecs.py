@@ -108,6 +108,20 @@ class DuTSpec(object):
 
         """
 
+    @dut_hookspec
+    def load_tests(self, test_list):
+        """ 
+        Optional stage which switches the plugin to another Test List after the ``init`` stage. In
+        ``compile --pipeline`` mode, RiVer Core calls ``init`` only once, with all the tests, and then this
+        stage with the Test List of every batch before the ``build`` and ``run`` stages of the batch, so
+        that the simulator is set up only once. The ``init`` stage of a plugin which does not implement it
+        is called again for every batch instead.
+
+        :param test_list: Path to the Test List YAML with the tests to build and run next 
+
+        :type test_list: str  
+        """
+
     @dut_hookspec
     def build(self):
         """ This stage is used to create a Makefile or script to actually compile each test,
@@ -132,6 +146,47 @@ class DuTSpec(object):
         :rtype: str
         """
 
+    @dut_hookspec(firstresult=True)
+    def run_batch(self, tests, module_dir):
+        """ 
+        Optional stage which replaces the ``run`` stage when a plugin implements it. Instead of
+        starting one simulator process per test, the plugin gets the tests in batches and can run a
+        whole batch in a single simulator process, loading the model once and feeding it one ELF after
+        the other. RiVer Core splits the test list into batches of ``batch_size`` tests from the plugin
+        section of the ``config.ini`` (by default one batch per job) and runs up to ``jobs`` batches at
+        a time, each in a thread of its own, so the hook has to be safe to call concurrently. The results
+        are written to a report in the same format as the one of the ``run`` stage.
+
+        :param tests: The Test List entries of the tests in the batch, keyed by the test names 
+
+        :param module_dir: Path to the module to be loaded. 
+
+        :type tests: dict 
+
+        :type module_dir: str 
+
+        :return: Result of every test in the batch as a dict with its ``returncode`` (0 when the test
+            passed) and optionally a ``message``, its ``stdout``, ``stderr`` and ``duration``, and
+            ``timeout`` set to True if the test was killed on its timeout. Tests left out of the dict are
+            failed.
+
+        :rtype: dict
+        """
+
+    @dut_hookspec(firstresult=True)
+    def worker_command(self):
+        """ 
+        Optional stage which replaces the ``run`` and ``run_batch`` stages when a plugin implements it.
+        RiVer Core then starts ``jobs`` long-lived simulator processes with the returned command, in the
+        ``work_dir``, and hands the tests to them one at a time, see :py:class:`river_core.simpool.SimWorker`
+        for the protocol. A simulator is replaced after ``worker_tests`` tests from the plugin section of
+        the ``config.ini`` (never by default), and whenever it crashes or a test times out.
+
+        :return: Shell command which starts a simulator worker
+
+        :rtype: str
+        """
+
     @dut_hookspec
     def post_run(self, test_dict, config):
         """ 
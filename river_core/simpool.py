@@ -0,0 +1,289 @@
+# See LICENSE for details
+"""Pool of long-lived simulator processes which run one test after another"""
+import os
+import json
+import time
+import queue
+import signal
+import threading
+import traceback
+import subprocess
+import collections
+
+from river_core.log import logger
+from river_core.utils import report_entry, tail_lines
+
+#: Seconds a worker gets to exit after its stdin is closed
+exit_timeout = 10
+
+
+class SimWorker():
+    """
+    A simulator process which runs the tests sent to it one at a time. The
+    process reads one request per line on its stdin, a JSON object with the
+    ``test`` name and the Test List entry of the test, and answers every
+    request with a JSON object on a line of its own on its stdout, holding
+    the ``returncode`` of the test (0 when it passed) and optionally a
+    ``message`` and the path of the ``dump`` it wrote, absolute or relative
+    to the ``work_dir`` of the test, if it is not the default one. The last
+    ``tail_lines`` of any other lines it prints, on stdout or stderr, are
+    kept as the output of the test.
+    """
+
+    def __init__(self, command, cwd=None):
+        """Constructor.
+
+        :param command: Shell command which starts the simulator
+
+        :param cwd: Directory to start the simulator in
+
+        :type command: str
+
+        :type cwd: str
+        """
+        self.command = command
+        logger.debug('Starting simulator worker: {0}'.format(command))
+        self.process = subprocess.Popen(command,
+                                        shell=True,
+                                        cwd=cwd,
+                                        stdin=subprocess.PIPE,
+                                        stdout=subprocess.PIPE,
+                                        stderr=subprocess.STDOUT,
+                                        start_new_session=True)
+        self.lines = queue.Queue()
+        self.count = 0
+        threading.Thread(target=self._read, daemon=True).start()
+
+    def _read(self):
+        for line in self.process.stdout:
+            self.lines.put(line.decode('ascii', errors='replace').rstrip())
+        self.lines.put(None)
+
+    def run(self, test, attr, timeout=None):
+        """
+        Run a test on the simulator.
+
+        :param test: Name of the test
+
+        :param attr: Test List entry of the test
+
+        :param timeout: Seconds to wait for the answer, None to wait forever
+
+        :type test: str
+
+        :type attr: dict
+
+        :type timeout: int
+
+        :returns: Dict with the ``returncode``, ``message``, ``stdout``,
+            ``stderr``, ``duration`` and ``dump`` of the test, and whether
+            it hit the ``timeout``. The
+            returncode is None if the simulator died or timed out, after
+            which the worker cannot be used any more.
+
+        :rtype: dict
+        """
+        start = time.time()
+        self.count += 1
+        output = collections.deque(maxlen=tail_lines)
+        result = {'returncode': None, 'dump': None, 'timeout': False}
+        request = dict(attr, test=test)
+        try:
+            self.process.stdin.write(
+                (json.dumps(request, default=str) + '\n').encode())
+            self.process.stdin.flush()
+        except OSError:
+            pass
+        while True:
+            remaining = None if timeout is None else \
+                max(0, start + timeout - time.time())
+            try:
+                line = self.lines.get(timeout=remaining)
+            except queue.Empty:
+                self.kill()
+                result['timeout'] = True
+                result['message'] = 'TimeoutExpired after {0} seconds'.format(
+                    timeout)
+                break
+            if line is None:
+                result['message'] = 'Simulator exited with {0}'.format(
+                    self.process.wait())
+                break
+            try:
+                response = json.loads(line)
+            except ValueError:
+                response = None
+            if isinstance(response, dict) and 'returncode' in response:
+                result['returncode'] = response['returncode']
+                result['dump'] = response.get('dump')
+                result['message'] = response.get(
+                    'message', 'Exited with {0}'.format(response['returncode']))
+                break
+            output.append(line)
+        result['stdout'] = '\n'.join(output)
+        result['stderr'] = ''
+        result['duration'] = time.time() - start
+        return result
+
+    def kill(self):
+        """Kill the simulator along with every process it started."""
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except OSError:
+            pass
+        self.process.wait()
+
+    def close(self):
+        """
+        Ask the simulator to exit by closing its stdin, and kill it if it
+        does not within ``exit_timeout`` seconds.
+        """
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+        try:
+            self.process.wait(timeout=exit_timeout)
+        except subprocess.TimeoutExpired:
+            self.kill()
+
+
+class SimPool():
+    """
+    Runs tests on a pool of :py:class:`SimWorker` processes, one per job, so
+    that the cost of starting the simulator and loading the model is paid
+    once for many tests instead of once per test. A worker is replaced after
+    ``max_tests`` tests, and whenever it dies or times out on a test. The
+    result of every test is appended to a report in the same format as the
+    one of :py:class:`river_core.utils.testRunner`.
+    """
+
+    def __init__(self, command, jobs=1, max_tests=0, cwd=None, timeout=None):
+        """Constructor.
+
+        :param command: Shell command which starts a simulator worker
+
+        :param jobs: Number of workers
+
+        :param max_tests: Tests after which a worker is replaced, 0 to keep
+            it for the whole run
+
+        :param cwd: Directory to start the workers in
+
+        :param timeout: Default timeout for a test in seconds
+
+        :type command: str
+
+        :type jobs: int
+
+        :type max_tests: int
+
+        :type cwd: str
+
+        :type timeout: int
+        """
+        self.command = command
+        self.jobs = max(1, int(jobs))
+        self.max_tests = max_tests
+        self.cwd = cwd
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.started = 0
+        self.crashed = 0
+
+    def _slot(self, tests, completed):
+        worker = None
+        while True:
+            try:
+                test, attr = tests.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                if worker is None:
+                    worker = SimWorker(self.command, self.cwd)
+                    with self.lock:
+                        self.started += 1
+                result = worker.run(test, attr,
+                                    attr.get('timeout') or self.timeout)
+            except Exception as e:
+                # Fail the test rather than leave execute waiting for it
+                result = {
+                    'returncode': None,
+                    'dump': None,
+                    'timeout': False,
+                    'message': 'Simulator worker failed: {0}'.format(e),
+                    'stdout': '',
+                    'stderr': traceback.format_exc(),
+                    'duration': 0
+                }
+            completed.put((test, attr, result))
+            if result['returncode'] is None:
+                with self.lock:
+                    self.crashed += 1
+                if worker is not None:
+                    worker.kill()
+                worker = None
+            elif self.max_tests and worker.count >= self.max_tests:
+                worker.close()
+                worker = None
+        if worker is not None:
+            worker.close()
+
+    def execute(self, test_dict, report_file):
+        """
+        Run the tests.
+
+        :param test_dict: Test List entries of the tests to run
+
+        :param report_file: Path of the JSON report to write, overwritten if
+            it exists.
+
+        :type test_dict: dict
+
+        :type report_file: str
+
+        :returns: The entry written to the report for every test
+
+        :rtype: dict
+        """
+        logger.info('Running {0} tests on {1} simulator workers'.format(
+            len(test_dict), self.jobs))
+        tests = queue.Queue()
+        for test, attr in test_dict.items():
+            tests.put((test, attr))
+        completed = queue.Queue()
+        slots = [
+            threading.Thread(target=self._slot,
+                             args=(tests, completed),
+                             daemon=True)
+            for slot in range(min(self.jobs, len(test_dict)))
+        ]
+        for slot in slots:
+            slot.start()
+        results = {}
+        with open(report_file, 'w') as report:
+            for count in range(len(test_dict)):
+                test, attr, result = completed.get()
+                entry = report_entry(
+                    {
+                        'name': test,
+                        'command': self.command,
+                        'cwd': attr.get('work_dir')
+                    }, result)
+                if result['dump']:
+                    entry['user_properties'].append(['dump', result['dump']])
+                report.write(json.dumps(entry) + '\n')
+                report.flush()
+                results[test] = entry
+                if entry['outcome'] != 'passed':
+                    logger.error('{0} failed: {1}'.format(
+                        test, result['message']))
+        for slot in slots:
+            slot.join()
+        failed = sum(1 for entry in results.values()
+                     if entry['outcome'] != 'passed')
+        logger.info('{0} of {1} tests passed'.format(
+            len(results) - failed, len(results)))
+        logger.info('Started {0} simulator workers, {1} of them crashed or '
+                    'timed out'.format(self.started, self.crashed))
+        return results
@@ -5,11 +5,11 @@ import shutil
 import random
 import re
 import datetime
-import pytest
 import glob
 
 from river_core.log import logger
 from river_core.utils import *
+from river_core.testlist import load_test_list
 
 dut_hookimpl = pluggy.HookimplMarker('dut')
 
@@ -40,7 +40,8 @@ class sample_plugin(object):
         # Get plugin specific configs from ini
         self.jobs = ini_config['jobs']
 
-        self.filter = ini_config['filter']
+        # Keyword expression selecting the tests, like pytest -k
+        self.filter = keyword_filter(ini_config['filter'])
 
         self.riscv_isa = ini_config['isa']
 
@@ -64,7 +65,7 @@ class sample_plugin(object):
         self.sim_path = self.work_dir + self.name
         os.makedirs(self.sim_path, exist_ok=True)
 
-        self.test_list = load_yaml(test_list)
+        self.load_tests(test_list)
 
         self.json_dir = self.work_dir + '/.json/'
 
@@ -104,6 +105,16 @@ class sample_plugin(object):
         # TODO: Create the simlation binary here
         sys_command(command, 500)
 
+    @dut_hookimpl
+    def load_tests(self, test_list):
+        # Also called with the tests of every batch in pipeline mode, which
+        # reuses the simulator set up by init
+        self.test_list = load_test_list(test_list)
+        # Filters on the fields in indexed_fields pick a subset of the tests,
+        # e.g. only the failed tests of one generator:
+        # self.test_list = load_test_list(test_list, generator='aapg',
+        #                                 result='Failed')
+
     @dut_hookimpl
     def build(self):
         logger.info('Build Hook')
@@ -137,6 +148,9 @@ class sample_plugin(object):
             compile_cmd += ' '.join(map(' -D{0}'.format,
                                         attr['compile_macros']))
             compile_cmd += ' -o dut.elf && '
+            # Use the shared ELF when river_core built it
+            if attr.get('elf'):
+                compile_cmd = 'ln -f -s {0} dut.elf && '.format(attr['elf'])
             sim_setup = 'ln -f -s ' + self.sim_path + '/sample_sim . && '
             sim_setup += 'ln -f -s ' + self.sim_path + '/boot.mem . && '
             post_process_cmd = 'head -n -4 rtl.dump > dut.dump && rm -f rtl.dump'
@@ -152,31 +166,20 @@ class sample_plugin(object):
     def run(self, module_dir):
         logger.info('Run Hook')
         logger.debug('Module dir: {0}'.format(module_dir))
-        pytest_file = module_dir + '/sample_plugin/gen_framework.py'
-        logger.debug('Pytest file: {0}'.format(pytest_file))
-
         report_file_name = '{0}/{1}_{2}'.format(
             self.json_dir, self.name,
             datetime.datetime.now().strftime("%Y%m%d-%H%M"))
 
-        pytest_state = pytest.main([
-            pytest_file,
-            '-x',  # Stop on first failure 
-            '-n={0}'.format(self.jobs),
-            '-k={0}'.format(self.filter),
-            '--html={0}.html'.format(self.work_dir + '/reports/' + self.name),
-            '--report-log={0}.json'.format(report_file_name),
-            '--work_dir={0}'.format(self.work_dir),
-            '--make_file={0}'.format(self.make_file),
-            '--key_list={0}'.format(self.test_names),
-            '--log-cli-level=DEBUG',
-            '-o log_cli=true',
-        ])
-        if pytest_state == (pytest.ExitCode.INTERRUPTED or
-                            pytest.ExitCode.TESTS_FAILED):
-            logger.error(
-                'DuT Plugin failed to compile tests, exiting river_core')
-            raise SystemExit
+        # TODO: Runs one make target per test, edit the command if required
+        runner = testRunner(jobs=self.jobs)
+        for test in self.test_names:
+            if not self.filter(test):
+                continue
+            runner.add_test(test,
+                            'make -f {0} {1}'.format(self.make_file, test),
+                            cwd=self.work_dir,
+                            timeout=self.test_list[test].get('timeout'))
+        runner.execute('{0}.json'.format(report_file_name))
 
         if self.coverage:
             # TODO: Run commands like writing coverage databases or logging the paths to report etc
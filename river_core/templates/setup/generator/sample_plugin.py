@@ -5,7 +5,6 @@ import shutil
 import random
 import re
 import datetime
-import pytest
 import glob
 from river_core.log import logger
 import river_core.utils as utils
@@ -45,6 +44,7 @@ class sample_plugin(object):
 
         # Extract plugin specific info
         self.jobs = spec_config['jobs']
+        self.count = int(spec_config['count'])
         self.seed = spec_config['seed']
         self.filter = spec_config['filter']
         self.isa = spec_config['isa']
@@ -67,8 +67,6 @@ class sample_plugin(object):
 
         logger.debug('sample Plugin gen phase')
         logger.debug(module_dir)
-        pytest_file = module_dir + '/sample_plugin/gen_framework.py'
-        logger.debug(pytest_file)
 
         output_dir = os.path.abspath(output_dir)
 
@@ -76,15 +74,24 @@ class sample_plugin(object):
             self.json_dir, self.name,
             datetime.datetime.now().strftime("%Y%m%d-%H%M"))
 
-        # TODO Change according to your generator requirements
-        pytest.main([
-            pytest_file, '-n={0}'.format(self.jobs),
-            '-k={0}'.format(self.filter), '-v', '--seed={0}'.format(self.seed),
-            '--html={0}/reports/sample.html'.format(output_dir),
-            '--report-log={0}.json'.format(report_file_name),
-            '--self-contained-html', '--output_dir={0}'.format(output_dir),
-            '--module_dir={0}'.format(module_dir)
-        ])
+        # Runs the generator once per test, edit the command as required.
+        # For a generator with several templates in its config_yaml, the
+        # filter selects the templates to generate from, e.g.
+        # utils.keyword_filter(self.filter)(template)
+        runner = utils.testRunner(jobs=self.jobs)
+        now = datetime.datetime.now().strftime('%d%m%Y%H%M%S%f')
+        for count in range(self.count):
+            if self.seed == 'random':
+                gen_seed = random.randint(0, 10000)
+            else:
+                gen_seed = int(self.seed) + count
+            gen_prefix = '{0:06}_{1}_{2}'.format(gen_seed, now, count)
+            runner.add_test(
+                gen_prefix,
+                'sample generate --output_dir {0} --asm_name {1} --seed {2}'.
+                format(output_dir, gen_prefix, gen_seed),
+                cwd=output_dir)
+        runner.execute('{0}.json'.format(report_file_name))
 
         # Generate Test List
         # Get the sample dir from output
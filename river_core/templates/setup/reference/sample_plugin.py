@@ -6,10 +6,10 @@ import random
 import re
 import glob
 import datetime
-import pytest
 
 from river_core.log import logger
 from river_core.utils import *
+from river_core.testlist import load_test_list
 
 dut_hookimpl = pluggy.HookimplMarker('dut')
 
@@ -28,7 +28,8 @@ class sample_plugin(object):
         # Get plugin specific configs from ini
         self.jobs = ini_config['jobs']
 
-        self.filter = ini_config['filter']
+        # Keyword expression selecting the tests, like pytest -k
+        self.filter = keyword_filter(ini_config['filter'])
 
         self.riscv_isa = ini_config['isa']
 
@@ -47,7 +48,7 @@ class sample_plugin(object):
         self.sim_args = '--log ref.dump --log-commits --isa={0} {1}'
 
         self.work_dir = os.path.abspath(work_dir) + '/'
-        self.test_list = load_yaml(test_list)
+        self.load_tests(test_list)
 
         self.json_dir = self.work_dir + '/.json/'
         # Check if dir exists
@@ -61,6 +62,16 @@ class sample_plugin(object):
             logger.error('sample not available in $PATH')
             raise SystemExit
 
+    @dut_hookimpl
+    def load_tests(self, test_list):
+        # Also called with the tests of every batch in pipeline mode, which
+        # reuses the simulator set up by init
+        self.test_list = load_test_list(test_list)
+        # Filters on the fields in indexed_fields pick a subset of the tests,
+        # e.g. only the failed tests of one generator:
+        # self.test_list = load_test_list(test_list, generator='aapg',
+        #                                 result='Failed')
+
     @dut_hookimpl
     def build(self):
         logger.debug('Build Hook')
@@ -101,6 +112,9 @@ class sample_plugin(object):
             compile_cmd += ' '.join(map(' -D{0}'.format,
                                         attr['compile_macros']))
             compile_cmd += ' -o ref.elf && '
+            # Use the shared ELF when river_core built it
+            if attr.get('elf'):
+                compile_cmd = 'ln -f -s {0} ref.elf && '.format(attr['elf'])
             post_process_cmd = ''
 
             # TODO: This creates the final command. This should be passed on to the next stage in any format, depending upon the format, developer is comfortable in.
@@ -114,22 +128,20 @@ class sample_plugin(object):
     def run(self, module_dir):
         logger.debug('Run Hook')
         logger.debug('Module dir: {0}'.format(module_dir))
-        pytest_file = module_dir + '/spike_plugin/gen_framework.py'
-        logger.debug('Pytest file: {0}'.format(pytest_file))
-
         report_file_name = '{0}/{1}_{2}'.format(
             self.json_dir, self.name,
             datetime.datetime.now().strftime("%Y%m%d-%H%M"))
 
-        pytest.main([
-            pytest_file, '-n={0}'.format(self.jobs),
-            '-k={0}'.format(self.filter),
-            '--html={0}.html'.format(self.work_dir + '/reports/' + self.name),
-            '--report-log={0}.json'.format(report_file_name),
-            '--work_dir={0}'.format(self.work_dir), '--make_file={0}'.format(
-                self.make_file), '--key_list={0}'.format(self.test_names),
-            '--log-cli-level=DEBUG', '-o log_cli=true'
-        ])
+        # TODO: Runs one make target per test, edit the command if required
+        runner = testRunner(jobs=self.jobs)
+        for test in self.test_names:
+            if not self.filter(test):
+                continue
+            runner.add_test(test,
+                            'make -f {0} {1}'.format(self.make_file, test),
+                            cwd=self.work_dir,
+                            timeout=self.test_list[test].get('timeout'))
+        runner.execute('{0}.json'.format(report_file_name))
 
         # TODO: Need to return the json file generated
         return report_file_name
@@ -0,0 +1,241 @@
+# See LICENSE for details
+"""Test List storage backends for river_core"""
+import os
+import json
+import sqlite3
+
+from river_core.log import logger
+import river_core.utils as utils
+
+#: Extensions which select the SQLite backend for a test list
+db_extensions = ('.db', '.sqlite')
+#: Test List fields stored in indexed columns which can be queried
+indexed_fields = ('generator', 'isa', 'result', 'work_dir')
+
+_schema = '''
+CREATE TABLE IF NOT EXISTS tests (
+    name TEXT PRIMARY KEY,
+    generator TEXT,
+    isa TEXT,
+    result TEXT,
+    work_dir TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tests_generator ON tests (generator);
+CREATE INDEX IF NOT EXISTS tests_isa ON tests (isa);
+CREATE INDEX IF NOT EXISTS tests_result ON tests (result);
+CREATE INDEX IF NOT EXISTS tests_work_dir ON tests (work_dir);
+'''
+
+
+def is_db(test_list):
+    '''
+        Check if a test list is stored in the SQLite backend.
+
+        :param test_list: Path to the test list
+
+        :type test_list: str
+
+        :rtype: bool
+    '''
+    return os.path.splitext(str(test_list))[1] in db_extensions
+
+
+class TestListDB():
+    """
+    SQLite backed Test List. Every test is stored as a row holding its
+    complete entry as JSON, along with copies of the ``generator``, ``isa``,
+    ``result`` and ``work_dir`` fields in indexed columns so that subsets of
+    the list can be selected without loading all of it.
+    """
+
+    def __init__(self, db_file):
+        """Constructor.
+
+        :param db_file: Path to the SQLite database. Created if it does not
+            exist.
+
+        :type db_file: str
+        """
+        self.db_file = db_file
+        self.conn = sqlite3.connect(db_file)
+        # WAL lets the plugins read the list while the core writes results
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript(_schema)
+
+    def close(self):
+        """Close the connection to the database."""
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return self.conn.execute('SELECT COUNT(*) FROM tests').fetchone()[0]
+
+    def _where(self, filters):
+        clauses = []
+        values = []
+        for field, value in filters.items():
+            if field not in indexed_fields:
+                raise ValueError(
+                    'Cannot query the test list on {0}. Valid fields: {1}'.
+                    format(field, ', '.join(indexed_fields)))
+            if isinstance(value, (list, tuple, set)):
+                value = list(value)
+                clauses.append('{0} IN ({1})'.format(
+                    field, ', '.join('?' * len(value))))
+                values.extend(value)
+            else:
+                clauses.append('{0} = ?'.format(field))
+                values.append(value)
+        if not clauses:
+            return '', values
+        return ' WHERE ' + ' AND '.join(clauses), values
+
+    def update(self, test_dict):
+        """
+        Insert or replace the given tests in the database.
+
+        :param test_dict: Test List entries to store
+
+        :type test_dict: dict
+        """
+        rows = [(test, attr.get('generator'), attr.get('isa'),
+                 attr.get('result'), attr.get('work_dir'), json.dumps(attr))
+                for test, attr in test_dict.items()]
+        with self.conn:
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO tests '
+                '(name, generator, isa, result, work_dir, data) '
+                'VALUES (?, ?, ?, ?, ?, ?)', rows)
+
+    def query(self, **filters):
+        """
+        Select the tests matching all the filters. A filter value may be a
+        single value or a list of accepted values, e.g.
+        ``query(generator='aapg', result=['Failed', 'Unavailable'])``.
+
+        :param filters: Values for the fields in ``indexed_fields``
+
+        :returns: Test List with the matching tests
+
+        :rtype: dict
+        """
+        where, values = self._where(filters)
+        cursor = self.conn.execute(
+            'SELECT name, data FROM tests' + where + ' ORDER BY rowid', values)
+        return {name: json.loads(data) for name, data in cursor}
+
+    def names(self, **filters):
+        """
+        Select the names of the tests matching all the filters.
+
+        :param filters: Values for the fields in ``indexed_fields``
+
+        :rtype: list
+        """
+        where, values = self._where(filters)
+        cursor = self.conn.execute(
+            'SELECT name FROM tests' + where + ' ORDER BY rowid', values)
+        return [row[0] for row in cursor]
+
+
+def _matches(attr, filters):
+    for field, value in filters.items():
+        if isinstance(value, (list, tuple, set)):
+            if attr.get(field) not in value:
+                return False
+        elif attr.get(field) != value:
+            return False
+    return True
+
+
+def load_test_list(test_list, **filters):
+    '''
+        Load a test list, optionally only the tests matching the filters.
+        Works on both YAML and SQLite (``.db``/``.sqlite``) test lists, while
+        only the latter avoids loading the complete list to apply the
+        filters. For example, all the failed tests from aapg:
+        ``load_test_list(test_list, generator='aapg', result='Failed')``
+
+        :param test_list: Path to the test list
+
+        :param filters: Values for the fields in ``indexed_fields``
+
+        :type test_list: str
+
+        :returns: Test List with the matching tests
+
+        :rtype: dict
+    '''
+    if is_db(test_list):
+        if not os.path.isfile(test_list):
+            logger.error('Test List {0} does not exist'.format(test_list))
+            raise SystemExit
+        with TestListDB(test_list) as db:
+            return db.query(**filters)
+    for field in filters:
+        if field not in indexed_fields:
+            raise ValueError(
+                'Cannot query the test list on {0}. Valid fields: {1}'.format(
+                    field, ', '.join(indexed_fields)))
+    test_dict = utils.load_yaml(test_list)
+    if not filters:
+        return test_dict
+    return {
+        test: attr
+        for test, attr in test_dict.items()
+        if _matches(attr, filters)
+    }
+
+
+def save_test_list(test_dict, test_list, tests=None):
+    '''
+        Write a test list back to the disk. YAML test lists are rewritten
+        atomically as a whole, whereas only the entries of ``tests`` are
+        written to a SQLite test list.
+
+        :param test_dict: The test list
+
+        :param test_list: Path to the test list
+
+        :param tests: Names of the tests which changed. All if None.
+
+        :type test_dict: dict
+
+        :type test_list: str
+
+        :type tests: list
+    '''
+    if not is_db(test_list):
+        utils.save_yaml_atomic(test_dict, test_list)
+        return
+    if tests is not None:
+        test_dict = {test: test_dict[test] for test in tests}
+    with TestListDB(test_list) as db:
+        db.update(test_dict)
+
+
+def convert_test_list(src, dest):
+    '''
+        Convert a test list between the YAML and SQLite formats. The format
+        of each file is picked from its extension.
+
+        :param src: Path to the test list to read
+
+        :param dest: Path to the test list to write. Overwritten if it exists.
+
+        :type src: str
+
+        :type dest: str
+    '''
+    test_dict = load_test_list(src)
+    if is_db(dest) and os.path.exists(dest):
+        os.remove(dest)
+    save_test_list(test_dict, dest)
+    logger.info('Converted {0} tests from {1} to {2}'.format(
+        len(test_dict), src, dest))
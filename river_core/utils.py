@@ -2,19 +2,43 @@
 """Provide Utility functions for river_core"""
 import sys
 import os
-import subprocess
 import shlex
+import re
+import subprocess
 from river_core.log import logger
 import distutils.util
 import ruamel
 import signal
 from ruamel.yaml import YAML
-from threading import Timer
 import pathlib
+import tempfile
+import pickle
+import json
+import time
+import asyncio
+import collections
+import threading
 
 yaml = YAML(typ="safe")
 yaml.default_flow_style = False
 yaml.allow_unicode = True
+#: Same as yaml, but writes mappings in their order instead of sorting them
+ordered_yaml = YAML(typ="safe")
+ordered_yaml.default_flow_style = False
+ordered_yaml.allow_unicode = True
+ordered_yaml.sort_base_mapping_type_on_output = False
+
+#: Keep a pickled side-car next to every YAML loaded through load_yaml
+yaml_cache = True
+
+#: Lines of the output of a command kept in memory when it is streamed
+tail_lines = 200
+
+# Size of the reads from the output of a command, and the longest line kept
+_chunk_size = 65536
+# Longest interval in seconds between two checks for the exit of a command,
+# where it cannot be waited for through a pidfd
+_poll_interval = 0.05
 
 
 def str_2_bool(string):
@@ -30,6 +54,75 @@ def str_2_bool(string):
     return bool(distutils.util.strtobool(string))
 
 
+def keyword_filter(expression):
+    """
+        Compile a test filter, a keyword expression like the ``-k`` option
+        of pytest. A keyword matches the names containing it, ignoring the
+        case, and keywords combine with ``and``, ``or``, ``not`` and
+        parentheses, e.g. ``uentry_fmv_x_d or uentry_fcvt_s_lu``.
+
+        :param expression: The filter, an empty one selects every test
+
+        :type expression: str
+
+        :returns: Function which checks if a test name matches the filter
+
+        :rtype: callable
+    """
+    tokens = re.findall(r'\(|\)|[^\s()]+', expression or '')
+    position = [0]
+
+    def peek():
+        return tokens[position[0]] if position[0] < len(tokens) else None
+
+    def take():
+        position[0] += 1
+        return tokens[position[0] - 1]
+
+    def parse_or():
+        terms = [parse_and()]
+        while peek() == 'or':
+            take()
+            terms.append(parse_and())
+        return lambda name: any(term(name) for term in terms)
+
+    def parse_and():
+        terms = [parse_not()]
+        while peek() == 'and':
+            take()
+            terms.append(parse_not())
+        return lambda name: all(term(name) for term in terms)
+
+    def parse_not():
+        token = peek()
+        if token == 'not':
+            take()
+            term = parse_not()
+            return lambda name: not term(name)
+        if token == '(':
+            take()
+            term = parse_or()
+            if peek() != ')':
+                raise ValueError('missing )')
+            take()
+            return term
+        if token is None or token in ('and', 'or', ')'):
+            raise ValueError('expected a keyword, got {0}'.format(token))
+        keyword = take().lower()
+        return lambda name: keyword in name.lower()
+
+    if not tokens:
+        return lambda name: True
+    try:
+        match = parse_or()
+        if peek() is not None:
+            raise ValueError('unexpected {0}'.format(peek()))
+    except ValueError as error:
+        logger.error('Invalid filter "{0}": {1}'.format(expression, error))
+        raise SystemExit
+    return match
+
+
 def save_yaml(data, out_file):
     """
         Save a dict to a file
@@ -49,9 +142,107 @@ def save_yaml(data, out_file):
         logger.error("File doesn't exist")
 
 
+def save_yaml_atomic(data, out_file):
+    '''
+        Save a dict to a YAML file atomically. The data is written to a
+        temporary file in the same directory which is then renamed over
+        ``out_file``, so readers never see a partially written file. The
+        keys are written in the order of ``data``.
+
+        :param data: Input data
+
+        :param out_file: Full/Abs path of Output file
+
+        :type data: dict
+
+        :type out_file: str
+    '''
+    out_dir = os.path.dirname(os.path.abspath(out_file))
+    fd, tmp_file = tempfile.mkstemp(dir=out_dir,
+                                    prefix='.' + os.path.basename(out_file),
+                                    suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as outfile:
+            ordered_yaml.dump(data, outfile)
+            outfile.flush()
+            os.fsync(outfile.fileno())
+        # mkstemp creates the file private to the user, keep the old mode
+        if os.path.exists(out_file):
+            os.chmod(tmp_file, os.stat(out_file).st_mode & 0o777)
+        else:
+            os.chmod(tmp_file, 0o644)
+        os.replace(tmp_file, out_file)
+    except BaseException:
+        os.remove(tmp_file)
+        raise
+    _write_yaml_cache(out_file, data)
+
+
+def _yaml_cache_file(input_yaml):
+    '''
+        Path of the side-car cache of a YAML file, a hidden file in the same
+        directory.
+    '''
+    head, tail = os.path.split(os.path.abspath(input_yaml))
+    return os.path.join(head, '.' + tail + '.cache')
+
+
+def _yaml_cache_key(input_yaml):
+    '''
+        Key identifying the current contents of a YAML file: its path,
+        modification time and size.
+    '''
+    stat = os.stat(input_yaml)
+    return (os.path.abspath(input_yaml), stat.st_mtime_ns, stat.st_size)
+
+
+def _read_yaml_cache(input_yaml):
+    '''
+        Load the data of a YAML file from its side-car cache.
+
+        :returns: The cached data or None if the cache is missing or stale
+
+        :rtype: dict
+    '''
+    try:
+        with open(_yaml_cache_file(input_yaml), 'rb') as cache:
+            key, data = pickle.load(cache)
+        if key == _yaml_cache_key(input_yaml):
+            return data
+    except Exception:
+        # Missing, unreadable or corrupt caches are simply rebuilt
+        pass
+    return None
+
+
+def _write_yaml_cache(input_yaml, data):
+    '''
+        Store the data of a YAML file in its side-car cache. Failing to write
+        the cache (e.g. read-only directories) is not an error.
+    '''
+    if not yaml_cache:
+        return
+    cache_file = _yaml_cache_file(input_yaml)
+    try:
+        key = _yaml_cache_key(input_yaml)
+        fd, tmp_file = tempfile.mkstemp(dir=os.path.dirname(cache_file),
+                                        prefix=os.path.basename(cache_file),
+                                        suffix='.tmp')
+        with os.fdopen(fd, 'wb') as cache:
+            pickle.dump((key, data), cache, protocol=pickle.HIGHEST_PROTOCOL)
+        os.chmod(tmp_file, 0o644)
+        os.replace(tmp_file, cache_file)
+    except Exception as msg:
+        logger.debug('Could not write YAML cache {0}: {1}'.format(
+            cache_file, msg))
+
+
 def load_yaml(input_yaml):
     """
-        Save a dict to a file
+        Load a YAML file as a dict. The parsed data is kept in a pickled
+        side-car next to the file (``.<name>.cache``), which is used instead
+        of parsing the YAML again as long as the path, modification time and
+        size of the file are unchanged.
 
         :param input_yaml: YAML file to read 
 
@@ -61,66 +252,469 @@ def load_yaml(input_yaml):
 
         :rtype: dict
     """
+    if yaml_cache:
+        data = _read_yaml_cache(input_yaml)
+        if data is not None:
+            return data
     try:
         with open(input_yaml, "r") as file:
-            return dict(yaml.load(file))
+            data = dict(yaml.load(file))
     except ruamel.yaml.constructor.DuplicateKeyError as msg:
         raise SystemExit
+    _write_yaml_cache(input_yaml, data)
+    return data
+
+
+def decode(data):
+    '''
+        Decode the output of a command. Bytes which are not ASCII are
+        replaced instead of raising an error.
+
+        :param data: Output of the command
+
+        :type data: bytes
+
+        :rtype: str
+    '''
+    return data.decode('ascii', errors='replace')
+
+
+async def _stream(reader, output, log):
+    partial = b''
+    while True:
+        chunk = await reader.read(_chunk_size)
+        if not chunk:
+            break
+        if log is not None:
+            log.write(chunk)
+        if isinstance(output, bytearray):
+            output.extend(chunk)
+            continue
+        *complete, partial = (partial + chunk).split(b'\n')
+        output.extend(complete)
+        partial = partial[-_chunk_size:]
+    if partial:
+        output.append(partial)
+
+
+# Started in place of a command, forks and runs the command and reports on
+# a pipe if it could not be started, or its resource usage once it exits.
+# Forked from this small process rather than from river_core, the command
+# does not inherit the peak memory of river_core, which Linux carries over
+# the fork.
+_reaper = '''
+import os, sys, signal
+fd = int(sys.argv[1])
+pid = os.fork()
+if pid == 0:
+    os.set_inheritable(fd, False)
+    try:
+        os.execvp(sys.argv[2], sys.argv[2:])
+    except OSError as e:
+        os.write(fd, 'error {0}\\n'.format(e.errno).encode())
+    os._exit(127)
+pid, status, usage = os.wait4(pid, 0)
+os.write(fd, 'usage {0} {1} {2}\\n'.format(usage.ru_utime, usage.ru_stime,
+                                            usage.ru_maxrss).encode())
+os.close(fd)
+if os.WIFSIGNALED(status):
+    try:
+        signal.signal(os.WTERMSIG(status), signal.SIG_DFL)
+    except (OSError, ValueError):
+        pass
+    os.kill(os.getpid(), os.WTERMSIG(status))
+os._exit(os.WEXITSTATUS(status))
+'''
+
+
+def _reaped(fd):
+    # Error number if the command could not be started, and the resource
+    # usage reported by the reaper, None if it did not get to it
+    data = b''
+    while True:
+        chunk = os.read(fd, 256)
+        if not chunk:
+            break
+        data += chunk
+    os.close(fd)
+    error = usage = None
+    for line in data.decode().splitlines():
+        words = line.split()
+        if words[:1] == ['error'] and len(words) == 2:
+            error = int(words[1])
+        elif words[:1] == ['usage'] and len(words) == 4:
+            usage = float(words[1]), float(words[2]), int(words[3])
+    return error, usage
+
+
+async def _pipe(file):
+    reader = asyncio.StreamReader(limit=_chunk_size)
+    transport, protocol = await asyncio.get_running_loop().connect_read_pipe(
+        lambda: asyncio.StreamReaderProtocol(reader), file)
+    return reader, transport
+
+
+async def _wait4(pid):
+    # The child is reaped here rather than by asyncio, since only wait4
+    # returns its resource usage
+    loop = asyncio.get_running_loop()
+    exited = None
+    if hasattr(os, 'pidfd_open'):
+        try:
+            pidfd = os.pidfd_open(pid)
+        except OSError:
+            pidfd = None
+        if pidfd is not None:
+            exited = loop.create_future()
+            loop.add_reader(
+                pidfd, lambda: exited.done() or exited.set_result(None))
+    delay = 0.001
+    try:
+        while True:
+            waited, status, usage = os.wait4(pid, os.WNOHANG)
+            if waited:
+                break
+            if exited is not None:
+                await exited
+            else:
+                await asyncio.sleep(delay)
+                delay = min(2 * delay, _poll_interval)
+    finally:
+        if exited is not None:
+            loop.remove_reader(pidfd)
+            os.close(pidfd)
+    if os.WIFSIGNALED(status):
+        returncode = -os.WTERMSIG(status)
+    else:
+        returncode = os.WEXITSTATUS(status)
+    return returncode, usage
+
+
+async def run_process(command,
+                      timeout=None,
+                      shell=True,
+                      log_file=None,
+                      tail=None,
+                      **kwargs):
+    '''
+        Run a command as a child process of the running asyncio event loop.
+        The command runs in a session of its own, so that all the processes
+        it starts are killed if it times out. The resource usage of the
+        command, including that of the processes it waited for, is taken
+        from ``wait4`` when it exits. The command is started by a small
+        reaper process, which takes its usage and passes it on, so that the
+        peak memory is that of the command and not the one of river_core,
+        which Linux carries over the fork. The usage of a command which
+        timed out is that of the reaper, without the peak memory.
+
+        By default the whole output of the command is kept in memory. In the
+        streaming mode, selected with ``log_file`` or ``tail``, the output
+        is written to the log file as it comes, and only its last lines are
+        kept, so that a command printing gigabytes does not need as much
+        memory.
+
+        :param command: Shell command to run, or the list of its arguments if
+            ``shell`` is False
+
+        :param timeout: Timeout in seconds, None to wait forever
+
+        :param shell: Run the command through the shell
+
+        :param log_file: File to write the stdout and stderr of the command
+            to, overwritten if it exists
+
+        :param tail: Number of lines of the stdout and of the stderr to
+            keep in the streaming mode. Defaults to ``tail_lines``.
+
+        :param kwargs: Further arguments for :py:class:`subprocess.Popen`,
+            such as ``cwd``. The output is captured unless ``stdout`` or
+            ``stderr`` are given.
+
+        :type command: str
+
+        :type timeout: int
+
+        :type shell: bool
+
+        :type log_file: str
+
+        :type tail: int
+
+        :returns: Dict with the ``returncode``, ``message``, ``stdout`` and
+            ``stderr`` (as bytes), ``duration``, whether the command hit the
+            ``timeout``, the path of its ``log`` and its ``rusage``: the user
+            and system CPU time (``utime``, ``stime``) and wall time
+            (``wall``) in seconds and the peak resident set size
+            (``maxrss``) in KB
+
+        :rtype: dict
+    '''
+    streaming = log_file is not None or tail is not None
+    if streaming:
+        kwargs.update(stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    else:
+        kwargs.setdefault('stdout', subprocess.PIPE)
+        kwargs.setdefault('stderr', subprocess.PIPE)
+    logger.debug('$ timeout={0} {1}'.format(
+        timeout, command if shell else ' '.join(map(str, command))))
+    start = time.time()
+    usage_fd, reaper_fd = os.pipe()
+    try:
+        process = subprocess.Popen(
+            [sys.executable, '-S', '-E', '-c', _reaper,
+             str(reaper_fd)] + (['/bin/sh', '-c', str(command)]
+                                if shell else list(map(str, command))),
+            start_new_session=True,
+            pass_fds=(reaper_fd,),
+            **kwargs)
+    except BaseException:
+        os.close(usage_fd)
+        raise
+    finally:
+        os.close(reaper_fd)
+    log = open(log_file, 'wb') if log_file is not None else None
+    if streaming:
+        out = collections.deque(maxlen=tail or tail_lines)
+        err = collections.deque(maxlen=tail or tail_lines)
+    else:
+        out = bytearray()
+        err = bytearray()
+    transports = []
+    readers = []
+    for pipe, output in ((process.stdout, out), (process.stderr, err)):
+        if pipe is not None:
+            reader, transport = await _pipe(pipe)
+            transports.append(transport)
+            readers.append(_stream(reader, output, log))
+    timed_out = False
+    try:
+        try:
+            returncode, usage = (await asyncio.wait_for(
+                asyncio.gather(*readers, _wait4(process.pid)), timeout))[-1]
+        except asyncio.TimeoutError:
+            timed_out = True
+            os.killpg(process.pid, signal.SIGKILL)
+            returncode, usage = await _wait4(process.pid)
+        except asyncio.CancelledError:
+            os.killpg(process.pid, signal.SIGKILL)
+            await _wait4(process.pid)
+            raise
+    finally:
+        for transport in transports:
+            transport.close()
+        if log is not None:
+            log.close()
+        # The reaper has exited, so this does not block
+        error, reaped = _reaped(usage_fd)
+    if error is not None:
+        # As Popen does for a program which cannot be run
+        raise OSError(error, os.strerror(error),
+                      '/bin/sh' if shell else str(command[0]))
+    # Let Popen know that the child is reaped
+    process.returncode = returncode
+    duration = time.time() - start
+    if timed_out:
+        message = 'TimeoutExpired after {0} seconds'.format(timeout)
+    else:
+        message = 'Exited with {0}'.format(returncode)
+    return {
+        'returncode': returncode,
+        'message': message,
+        'stdout': b'\n'.join(out) if streaming else bytes(out),
+        'stderr': b'\n'.join(err) if streaming else bytes(err),
+        'duration': duration,
+        'timeout': timed_out,
+        'log': log_file,
+        'rusage': {
+            'utime': round(reaped[0] if reaped else usage.ru_utime, 3),
+            'stime': round(reaped[1] if reaped else usage.ru_stime, 3),
+            'maxrss': reaped[2] if reaped else None,
+            'wall': round(duration, 3)
+        }
+    }
+
+
+class ProcessLoop():
+    """
+    An asyncio event loop running in a thread of its own, on which the
+    commands of synchronous code are run. It serves code which runs inside
+    another event loop, and several threads which run commands at the same
+    time, such as the slots of a ``river_core worker``, from a single loop.
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever,
+                                       daemon=True)
+        self.thread.start()
+
+    def run(self, coroutine):
+        """
+        Run a coroutine on the loop and wait for its result. The coroutine
+        is cancelled if the wait is interrupted.
+
+        :param coroutine: The coroutine to run
+
+        :type coroutine: coroutine
+
+        :returns: The value returned by the coroutine
+        """
+        future = asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+        try:
+            return future.result()
+        except BaseException:
+            future.cancel()
+            raise
+
+    def close(self):
+        """Stop the loop and its thread."""
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
 
 
-def sys_command(command, timeout=240):
+def _in_loop():
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+def run_processes(commands, jobs=None):
+    '''
+        Run many commands as child processes supervised by a single asyncio
+        event loop, with up to ``jobs`` of them running at a time. Unlike a
+        pool of threads, thousands of commands can be in flight at once.
+        When called from code which already runs an event loop, the commands
+        are supervised by a loop in a helper thread instead.
+
+        :param commands: Dict of a key for every command to the arguments of
+            :py:func:`run_process` for it
+
+        :param jobs: Number of commands to run at a time, None for no limit
+
+        :type commands: dict
+
+        :type jobs: int
+
+        :returns: Generator of (key, result) tuples in the order the commands
+            finish, the result being the one of :py:func:`run_process`. The
+            commands still running are killed if the generator is closed.
+
+        :rtype: generator
+    '''
+    # The event loop of the thread, if it has one, is left alone
+    if _in_loop():
+        helper = ProcessLoop()
+        call = helper.run
+    else:
+        helper = None
+        loop = asyncio.new_event_loop()
+        call = loop.run_until_complete
+
+    async def run(limit, key, kwargs):
+        if limit is None:
+            return key, await run_process(**kwargs)
+        async with limit:
+            return key, await run_process(**kwargs)
+
+    async def start():
+        # The semaphore has to be created in the loop it is used in
+        limit = asyncio.Semaphore(jobs) if jobs else None
+        return [
+            asyncio.ensure_future(run(limit, key, kwargs))
+            for key, kwargs in commands.items()
+        ]
+
+    async def wait(pending):
+        return await asyncio.wait(pending,
+                                  return_when=asyncio.FIRST_COMPLETED)
+
+    async def stop(tasks):
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    tasks = []
+    try:
+        tasks = call(start())
+        pending = set(tasks)
+        while pending:
+            done, pending = call(wait(pending))
+            for task in done:
+                yield task.result()
+    finally:
+        call(stop(tasks))
+        if helper is not None:
+            helper.close()
+        else:
+            loop.close()
+
+
+def _run_one(loop=None, **kwargs):
+    if loop is not None:
+        return loop.run(run_process(**kwargs))
+    for key, result in run_processes({None: kwargs}):
+        return result
+
+
+def sys_command(command, timeout=240, log_file=None, tail=None):
     '''
         Wrapper function to run shell commands with a timeout.
-        Uses :py:mod:`subprocess`, :py:mod:`shlex`, :py:mod:`os`
+        Uses :py:func:`run_process` and :py:mod:`shlex`
         to ensure proper termination on timeout
 
         :param command: The shell command to run.
 
         :param timeout: The value after which the framework exits. Default set to configured to 240 seconds
 
+        :param log_file: Stream the output to this file and only return its
+            last lines, see :py:func:`run_process`
+
+        :param tail: Number of lines to return in the streaming mode
+
         :type command: list
 
         :type timeout: int
 
+        :type log_file: str
+
+        :type tail: int
+
         :returns: Error Code (int) ; STDOUT ; STDERR
 
         :rtype: list
     '''
     logger.warning('$ timeout={1} {0} '.format(' '.join(shlex.split(command)),
                                                timeout))
-    out = ''
-    err = ''
-    with subprocess.Popen(shlex.split(command),
-                          stdout=subprocess.PIPE,
-                          stderr=subprocess.PIPE,
-                          start_new_session=True) as process:
-        try:
-            out, err = process.communicate(timeout=timeout)
-        except subprocess.TimeoutExpired:
-            process.kill()
-            pgrp = os.getpgid(process.pid)
-            os.killpg(pgrp, signal.SIGTERM)
-            return 1, "GuruMeditation", "TimeoutExpired"
-
-    out = out.rstrip()
-    err = err.rstrip()
-    if process.returncode != 0:
+    result = _run_one(command=shlex.split(command),
+                      shell=False,
+                      timeout=timeout,
+                      log_file=log_file,
+                      tail=tail)
+    if result['timeout']:
+        return 1, "GuruMeditation", "TimeoutExpired"
+
+    out = result['stdout'].rstrip()
+    err = result['stderr'].rstrip()
+    if result['returncode'] != 0:
         if out:
-            logger.error(out.decode("ascii"))
+            logger.error(decode(out))
         if err:
-            logger.error(err.decode("ascii"))
+            logger.error(decode(err))
     else:
         if out:
-            logger.debug(out.decode("ascii"))
+            logger.debug(decode(out))
         if err:
-            logger.debug(err.decode("ascii"))
-    return (process.returncode, out.decode("ascii"), err.decode("ascii"))
+            logger.debug(decode(err))
+    return (result['returncode'], decode(out), decode(err))
 
 
 def sys_command_file(command, filename, timeout=500):
     '''
         Wrapper function to run shell commands with a timeout which involve operating with a file.
-        Uses :py:mod:`subprocess`, :py:mod:`shlex`, :py:mod:`os`
+        Uses :py:func:`run_process` and :py:mod:`shlex`
         to ensure proper termination on timeout
 
         :param command: The shell command to run.
@@ -145,18 +739,14 @@ def sys_command_file(command, filename, timeout=500):
     cmd = [x.strip(' ') for x in cmd]
     cmd = [i for i in cmd if i]
     logger.warning('$ {0} > {1}'.format(' '.join(cmd), filename))
-    fp = open(filename, 'w')
-    x = subprocess.Popen(cmd, stdout=fp, stderr=fp)
-    timer = Timer(timeout, x.kill)
-    try:
-        timer.start()
-        stdout, stderr = x.communicate()
-    finally:
-        timer.cancel()
-
-    fp.close()
+    with open(filename, 'w') as fp:
+        result = _run_one(command=cmd,
+                          shell=False,
+                          timeout=timeout,
+                          stdout=fp,
+                          stderr=fp)
 
-    return (x.returncode, None, None)
+    return (result['returncode'], None, None)
 
 
 class makeUtil():
@@ -236,6 +826,238 @@ class makeUtil():
                             " " + " ".join(self.targets)).run(cwd=cwd)
 
 
+def run_test_command(command, cwd=None, timeout=240, log_file=None,
+                     loop=None):
+    '''
+        Run the shell command of a test in a session of its own, so that all
+        the processes it starts are killed if it times out.
+
+        :param command: Shell command to run
+
+        :param cwd: Directory to run the command in
+
+        :param timeout: Timeout in seconds
+
+        :param log_file: Stream the output to this file and only keep its
+            last ``tail_lines`` lines, see :py:func:`run_process`
+
+        :param loop: Loop to run the command on, shared with other threads.
+            A loop of its own by default.
+
+        :type command: str
+
+        :type cwd: str
+
+        :type timeout: int
+
+        :type log_file: str
+
+        :type loop: ProcessLoop
+
+        :returns: Dict with the ``returncode``, ``message``, ``stdout``,
+            ``stderr``, ``duration`` and ``log`` of the command
+
+        :rtype: dict
+    '''
+    result = _run_one(loop=loop,
+                      command=command,
+                      cwd=cwd,
+                      timeout=timeout,
+                      log_file=log_file)
+    return _decoded(result)
+
+
+def _decoded(result):
+    return dict(result,
+                stdout=decode(result['stdout']).rstrip(),
+                stderr=decode(result['stderr']).rstrip())
+
+
+def report_entry(test, result):
+    '''
+        Create the entry of a test in a report, in the format of the JSON
+        report log of pytest.
+
+        :param test: The ``name``, ``command`` and ``cwd`` of the test
+
+        :param result: The ``returncode``, ``message``, ``stdout``,
+            ``stderr`` and ``duration`` of the test, as returned by
+            :py:func:`run_test_command`. The test passed if the returncode
+            is 0. The ``timeout`` flag, the ``log`` and the ``rusage`` of
+            the test, if set, are recorded in its ``user_properties``.
+
+        :type test: dict
+
+        :type result: dict
+
+        :rtype: dict
+    '''
+    passed = result['returncode'] == 0
+    return {
+        '$report_type': 'TestReport',
+        'nodeid': test['name'],
+        'location': [test['cwd'], None, test['name']],
+        'keywords': {
+            test['name']: 1
+        },
+        'when': 'call',
+        'outcome': 'passed' if passed else 'failed',
+        'longrepr': None if passed else {
+            'reprcrash': {
+                'message': result['message']
+            }
+        },
+        'sections': [['Command', test['command']],
+                     ['Captured stdout call', result['stdout']],
+                     ['Captured stderr call', result['stderr']]],
+        'duration': result['duration'],
+        'user_properties': [[name, result[name]]
+                            for name in ('timeout', 'log', 'rusage')
+                            if result.get(name)],
+    }
+
+
+class testRunner():
+    """
+    Utility to run a set of per-test commands in parallel without going
+    through pytest. Commands run as shell commands on a bounded pool of
+    workers, each with its own timeout. The result of every test is appended
+    to a report file as soon as the test finishes. The report uses the same
+    format as the JSON report log of pytest, so it can be returned from the
+    run hook of a plugin in place of one.
+
+    With a coordinator address, the tests are handed out to the
+    ``river_core worker`` processes connecting to it instead, see
+    :py:mod:`river_core.distributed`.
+
+    With a log directory, the output of every test run locally is streamed
+    to ``<log_dir>/<name>.log`` and only its last lines are kept in the
+    report.
+    """
+
+    #: Address (``host:port``) to distribute the tests from by default, set
+    #: from the ``coordinator`` option of the config.ini
+    coordinator = None
+
+    #: Directory to stream the output of the tests to by default, set from
+    #: the ``test_logs`` option of the config.ini
+    log_dir = None
+
+    def __init__(self, jobs=1, timeout=240, coordinator=None, log_dir=None):
+        """Constructor.
+
+        :param jobs: Number of tests to run in parallel
+
+        :param timeout: Default timeout for a test in seconds
+
+        :param coordinator: Address (``host:port``) to distribute the tests
+            from. Defaults to :py:attr:`testRunner.coordinator`.
+
+        :param log_dir: Directory to stream the output of the tests to.
+            Defaults to :py:attr:`testRunner.log_dir`.
+
+        :type jobs: int
+
+        :type timeout: int
+
+        :type coordinator: str
+
+        :type log_dir: str
+        """
+        self.jobs = max(1, int(jobs))
+        self.timeout = timeout
+        self.coordinator = coordinator or testRunner.coordinator
+        self.log_dir = log_dir or testRunner.log_dir
+        self.tests = []
+
+    def add_test(self, name, command, cwd=None, timeout=None):
+        """
+        Function to add a test to run.
+
+        :param name: Name of the test, this should be the key of the test in
+            the test list.
+
+        :param command: Shell command to run for the test
+
+        :param cwd: The working directory to run the command in
+
+        :param timeout: Timeout for this test. The default timeout of the
+            runner is used if not specified.
+
+        :type name: str
+
+        :type command: str
+
+        :type cwd: str
+
+        :type timeout: int
+        """
+        self.tests.append({
+            'name': name,
+            'command': command,
+            'cwd': cwd,
+            'timeout': timeout if timeout is not None else self.timeout
+        })
+
+    def _completed(self):
+        if self.coordinator:
+            # Imported here since the distributed module uses this one
+            from river_core.distributed import Coordinator
+            logger.info('Distributing {0} tests from {1}'.format(
+                len(self.tests), self.coordinator))
+            for test, result in Coordinator(self.coordinator).run(self.tests):
+                yield test, result
+            return
+        logger.info('Running {0} tests with {1} jobs'.format(
+            len(self.tests), self.jobs))
+        commands = {
+            index: {
+                'command': test['command'],
+                'cwd': test['cwd'],
+                'timeout': test['timeout']
+            } for index, test in enumerate(self.tests)
+        }
+        if self.log_dir:
+            os.makedirs(self.log_dir, exist_ok=True)
+            for index, test in enumerate(self.tests):
+                commands[index]['log_file'] = os.path.join(
+                    self.log_dir, test['name'] + '.log')
+        for index, result in run_processes(commands, self.jobs):
+            yield self.tests[index], _decoded(result)
+
+    def execute(self, report_file):
+        """
+        Function to run all the added tests.
+
+        :param report_file: Path of the JSON report to write, overwritten if
+            it exists.
+
+        :type report_file: str
+
+        :returns: The entry written to the report for every test
+
+        :rtype: dict
+        """
+        results = {}
+        with open(report_file, 'w') as report:
+            for test, result in self._completed():
+                entry = report_entry(test, result)
+                report.write(json.dumps(entry) + '\n')
+                report.flush()
+                results[test['name']] = entry
+                if entry['outcome'] == 'passed':
+                    logger.debug('{0} passed in {1:.2f}s'.format(
+                        test['name'], entry['duration']))
+                else:
+                    logger.error('{0} failed: {1}'.format(
+                        test['name'], entry['longrepr']['reprcrash']['message']))
+        failed = sum(1 for entry in results.values()
+                     if entry['outcome'] != 'passed')
+        logger.info('{0} of {1} tests passed'.format(
+            len(results) - failed, len(results)))
+        return results
+
+
 class Command():
     """
     Class for command build which is supported
@@ -305,7 +1127,7 @@ class Command():
     def run(self, **kwargs):
         """Execute the current command.
 
-        Uses :py:class:`subprocess.Popen` to execute the command.
+        Uses :py:func:`run_process` to execute the command.
 
         :return: The return code of the process     .
         :raise subprocess.CalledProcessError: If `check` is set
@@ -322,24 +1144,20 @@ class Command():
         # The arguments to be string.
         logger.debug(str(self))
         cmd = str(self) if kwargs['shell'] else self
-        x = subprocess.Popen(cmd,
-                             stdout=subprocess.PIPE,
-                             stderr=subprocess.PIPE,
-                             **kwargs)
-        out, err = x.communicate()
-        out = out.rstrip()
-        err = err.rstrip()
-        if x.returncode != 0:
+        result = _run_one(command=cmd, **kwargs)
+        out = result['stdout'].rstrip()
+        err = result['stderr'].rstrip()
+        if result['returncode'] != 0:
             if out:
-                logger.error(out.decode("ascii"))
+                logger.error(decode(out))
             if err:
-                logger.error(err.decode("ascii"))
+                logger.error(decode(err))
         else:
             if out:
-                logger.warning(out.decode("ascii"))
+                logger.warning(decode(out))
             if err:
-                logger.warning(err.decode("ascii"))
-        return x.returncode
+                logger.warning(decode(err))
+        return result['returncode']
 
     def _is_shell_command(self):
         """
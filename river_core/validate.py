@@ -0,0 +1,320 @@
+# See LICENSE for details
+"""Test List validation engine for river_core"""
+import os
+import concurrent.futures
+
+from ruamel.yaml import YAML
+
+from river_core.log import logger
+from river_core.constants import testlist_schema
+
+_types = {
+    'string': str,
+    'list': list,
+    'dict': dict,
+    'integer': int,
+    'boolean': bool
+}
+_supported_rules = ('type', 'required', 'nullable', 'check_with', 'schema',
+                    'empty', 'default')
+
+
+class PathCache():
+    """
+    Existence checks for files and directories answered from a listing of
+    their parent directory. Each directory is listed only once, no matter how
+    many tests refer to files in it, which keeps the number of filesystem
+    round trips low on network mounted work directories.
+    """
+
+    def __init__(self):
+        self.listings = {}
+
+    def _list(self, directory):
+        files = set()
+        dirs = set()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    # Both follow symlinks just like os.path.isfile/isdir
+                    if entry.is_dir():
+                        dirs.add(entry.name)
+                    elif entry.is_file():
+                        files.add(entry.name)
+        except OSError:
+            pass
+        return files, dirs
+
+    def _listing(self, directory):
+        if directory not in self.listings:
+            self.listings[directory] = self._list(directory)
+        return self.listings[directory]
+
+    def prefetch(self, paths, jobs=16):
+        """
+        List the parent directories of all the paths in parallel threads.
+
+        :param paths: Paths which will be checked
+
+        :param jobs: Number of directories listed concurrently
+
+        :type paths: iterable
+
+        :type jobs: int
+        """
+        directories = set()
+        for path in paths:
+            directories.add(os.path.dirname(os.path.abspath(path)))
+        directories -= set(self.listings)
+        if not directories:
+            return
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=max(1, min(jobs, len(directories)))) as pool:
+            for directory, listing in zip(
+                    directories, pool.map(self._list, directories)):
+                self.listings[directory] = listing
+
+    def isfile(self, path):
+        """Check if a file exists, same as :py:func:`os.path.isfile`."""
+        head, tail = os.path.split(os.path.abspath(path))
+        return bool(tail) and tail in self._listing(head)[0]
+
+    def isdir(self, path):
+        """Check if a directory exists, same as :py:func:`os.path.isdir`."""
+        head, tail = os.path.split(os.path.abspath(path))
+        if not tail:
+            return os.path.isdir(path)
+        return tail in self._listing(head)[1]
+
+
+def _compile_field(field, rules):
+    '''
+        Compile the rules of a field into a function which checks a value.
+        The function returns a list of errors in the format used by cerberus.
+    '''
+    unknown = set(rules) - set(_supported_rules)
+    if unknown:
+        raise ValueError('Unsupported rules for {0}: {1}'.format(
+            field, ', '.join(sorted(unknown))))
+    type_name = rules.get('type')
+    value_type = _types[type_name] if type_name else object
+    # cerberus fills in the default for a null value before validating it
+    nullable = rules.get('nullable', False) or 'default' in rules
+    empty = rules.get('empty', True)
+    check_with = rules.get('check_with')
+    check_item = _compile_field(field,
+                                rules['schema']) if 'schema' in rules else None
+
+    def check(value, files, dirs):
+        if value is None:
+            return [] if nullable else ['null value not allowed']
+        # Like cerberus, a bool is accepted as an integer
+        if not isinstance(value, value_type):
+            return ['must be of {0} type'.format(type_name)]
+        errors = []
+        if not empty and isinstance(value, (str, list, dict)) and not value:
+            errors.append('empty values not allowed')
+        if check_with == 'filecheck' and value not in files:
+            errors.append('File {0} not found'.format(value))
+        elif check_with == 'dircheck' and value not in dirs:
+            errors.append('Dir {0} not found'.format(value))
+        if check_item is not None and isinstance(value, list):
+            item_errors = {}
+            for index, item in enumerate(value):
+                item_error = check_item(item, files, dirs)
+                if item_error:
+                    item_errors[index] = item_error
+            if item_errors:
+                errors.append(item_errors)
+        return errors
+
+    return check
+
+
+def _field_paths(rules, value):
+    '''
+        Yield the (kind, path) tuples which have to be checked on the disk
+        for a value of a field.
+    '''
+    if value is None:
+        return
+    if rules.get('check_with') in ('filecheck', 'dircheck') and \
+            isinstance(value, str):
+        yield rules['check_with'], value
+    if 'schema' in rules and isinstance(value, list):
+        for item in value:
+            for path in _field_paths(rules['schema'], item):
+                yield path
+
+
+class TestListChecker():
+    """
+    A test list schema compiled into plain Python checks. Supports the subset
+    of the cerberus rules used by the test list schema (``type``,
+    ``required``, ``nullable``, ``empty``, ``schema``, ``default`` and the
+    ``filecheck``/``dircheck`` functions of
+    :py:class:`river_core.constants.YamlValidator`).
+    """
+
+    def __init__(self, schema, allow_unknown=False):
+        """Constructor.
+
+        :param schema: The parsed schema
+
+        :param allow_unknown: Accept fields which are not in the schema
+
+        :type schema: dict
+
+        :type allow_unknown: bool
+        """
+        self.schema = schema
+        self.allow_unknown = allow_unknown
+        # A missing field with a default gets the default from cerberus
+        self.required = [
+            field for field, rules in schema.items()
+            if rules.get('required') and 'default' not in rules
+        ]
+        self.checks = {
+            field: _compile_field(field, rules)
+            for field, rules in schema.items()
+        }
+
+    def paths(self, entry):
+        """
+        Get the paths referred to by a test which have to be checked on the
+        disk.
+
+        :param entry: Test List entry of a test
+
+        :type entry: dict
+
+        :returns: Generator of (``filecheck``/``dircheck``, path) tuples
+
+        :rtype: generator
+        """
+        for field, value in entry.items():
+            if field in self.schema:
+                for path in _field_paths(self.schema[field], value):
+                    yield path
+
+    def check(self, entry, files, dirs):
+        """
+        Validate a test.
+
+        :param entry: Test List entry of a test
+
+        :param files: Paths which are known to be existing files
+
+        :param dirs: Paths which are known to be existing directories
+
+        :type entry: dict
+
+        :type files: set
+
+        :type dirs: set
+
+        :returns: Errors per field, empty if the test is valid
+
+        :rtype: dict
+        """
+        if not isinstance(entry, dict):
+            return {'': ['must be of dict type']}
+        errors = {}
+        for field in self.required:
+            if field not in entry:
+                errors[field] = ['required field']
+        for field, value in entry.items():
+            check = self.checks.get(field)
+            if check is None:
+                if not self.allow_unknown:
+                    errors[field] = ['unknown field']
+                continue
+            field_errors = check(value, files, dirs)
+            if field_errors:
+                errors[field] = field_errors
+        return errors
+
+
+# State of the validation worker processes
+_worker = {}
+
+
+def _init_worker(schema, allow_unknown, files, dirs):
+    _worker['checker'] = TestListChecker(schema, allow_unknown)
+    _worker['files'] = files
+    _worker['dirs'] = dirs
+
+
+def _check_batch(batch):
+    checker = _worker['checker']
+    errors = {}
+    for test, entry in batch:
+        test_errors = checker.check(entry, _worker['files'], _worker['dirs'])
+        if test_errors:
+            errors[test] = test_errors
+    return errors
+
+
+def validate_test_list(test_dict, schema=None, jobs=1, allow_unknown=False):
+    '''
+        Validate all the tests in a test list against the schema. All the
+        files and directories referred to by the tests are checked up front
+        from a shared cache of directory listings, after which the tests are
+        validated in batches across a pool of processes.
+
+        :param test_dict: The test list to validate
+
+        :param schema: The parsed schema. Defaults to ``testlist_schema``.
+
+        :param jobs: Number of processes to validate with
+
+        :param allow_unknown: Accept fields which are not in the schema
+
+        :type test_dict: dict
+
+        :type schema: dict
+
+        :type jobs: int
+
+        :type allow_unknown: bool
+
+        :returns: Errors per field of every invalid test
+
+        :rtype: dict
+    '''
+    if schema is None:
+        schema = dict(YAML(typ='safe').load(testlist_schema))
+    checker = TestListChecker(schema, allow_unknown)
+
+    # Resolve all the filesystem checks together
+    checks = set()
+    for entry in test_dict.values():
+        if isinstance(entry, dict):
+            checks.update(checker.paths(entry))
+    path_cache = PathCache()
+    path_cache.prefetch(path for kind, path in checks)
+    files = set(path for kind, path in checks
+                if kind == 'filecheck' and path_cache.isfile(path))
+    dirs = set(path for kind, path in checks
+               if kind == 'dircheck' and path_cache.isdir(path))
+    logger.debug('Checked {0} paths in {1} directories'.format(
+        len(checks), len(path_cache.listings)))
+
+    tests = list(test_dict.items())
+    if jobs <= 1 or len(tests) <= 1:
+        _init_worker(schema, allow_unknown, files, dirs)
+        return _check_batch(tests)
+
+    batch_size = max(1, min(1024, len(tests) // (jobs * 4)))
+    errors = {}
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers=jobs,
+            initializer=_init_worker,
+            initargs=(schema, allow_unknown, files, dirs)) as pool:
+        batches = [
+            tests[start:start + batch_size]
+            for start in range(0, len(tests), batch_size)
+        ]
+        for batch_errors in pool.map(_check_batch, batches):
+            errors.update(batch_errors)
+    return errors